@@ -1,15 +1,49 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import abc
 import argparse
+import array
+import bisect
+import concurrent.futures
+import contextlib
+import csv
 import datetime
+import fnmatch
+import functools
+import hashlib
+import heapq
+import io
+import itertools
 import json
 import logging
+import mmap
+import os
+import pathlib
+import random
 import re
+import sqlite3
 import sys
+import threading
+import time
+import zipfile
 from timeit import default_timer as timer
-from typing import Dict, List, Optional
+from typing import IO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import requests
+import requests.adapters
+import requests.structures
+try:
+    import numpy as np
+except ImportError:  # only needed by the aggregation engine.
+    np = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pa_parquet
+except ImportError:  # only needed by the parquet exporter.
+    pa = None
+    pa_parquet = None
+
+from file_utils import atomic_write_text
 
 logger = logging.getLogger(__name__)
 
@@ -17,15 +51,339 @@ logger = logging.getLogger(__name__)
 OWNER = "CleverRaven"
 REPO = "Cataclysm-DDA"
 URL_TEMPLATE = "https://api.github.com/repos/{owner}/{repository}/releases"
-HEADERS = {'User-Agent': 'neitsa'}
+HEADERS = {'User-Agent': 'neitsa', 'Accept-Encoding': 'gzip'}
+PER_PAGE = 100  # maximum page size allowed by the GitHub REST API.
+
+# asset platform flags, see `AssetClassifier`.
+ASSET_ANDROID = 1 << 0
+ASSET_LINUX = 1 << 1
+ASSET_MAC = 1 << 2
+ASSET_WINDOWS = 1 << 3
+ASSET_CURSES = 1 << 4
+ASSET_TILES = 1 << 5
+ASSET_32_BIT = 1 << 6
+ASSET_64_BIT = 1 << 7
+ASSET_OS_MASK = ASSET_ANDROID | ASSET_LINUX | ASSET_MAC | ASSET_WINDOWS
+ASSET_UI_MASK = ASSET_CURSES | ASSET_TILES
+CLASSIFIER_VERSION = 1  # bump when the classification rules change; invalidates the on-disk cache.
+# OS name -> asset flag.
+OS_FLAGS = {
+    "Android": ASSET_ANDROID,
+    "Linux": ASSET_LINUX,
+    "OSX": ASSET_MAC,
+    "Windows": ASSET_WINDOWS
+}
+UNCLASSIFIED = "Unclassified"
+EXPORT_OS_COLUMNS = list(OS_FLAGS.keys()) + [UNCLASSIFIED]
+
+# the only release and asset fields used by the tool; everything else in the API payload (release notes body,
+# author and uploader objects, api urls...) is dropped as soon as a release is decoded.
+RELEASE_FIELDS = ("id", "tag_name", "name", "published_at", "prerelease")
+ASSET_FIELDS = ("id", "name", "label", "download_count", "size", "browser_download_url", "digest")
+CHUNK_SIZE = 64 * 1024
+OUTPUT_CHUNK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 30  # seconds.
+RETRY_STATUSES = {429, 500, 502, 503, 504}  # plus 403 when it's a rate limit answer.
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    # a single session keeps connections alive between requests, so only the first request to the host pays for the
+    # TCP and TLS handshakes. The pool must be at least as large as the number of concurrent workers.
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # cumulative: observations <= bucket bound.
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    # Per-run instrumentation: counters (requests, bytes, cache hits, retries, per-stage seconds) and latency
+    # histograms. Written at exit as a json summary or in the Prometheus text format.
+    PREFIX = "cdda_releases"
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = dict()
+        self._histograms: Dict[str, Histogram] = dict()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    def add_stage_time(self, stage: str, seconds: float) -> None:
+        self.inc("stage_seconds_total", seconds, stage=stage)
+
+    @contextlib.contextmanager
+    def time_stage(self, stage: str) -> Iterator[None]:
+        start = timer()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, timer() - start)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            counters: Dict[str, object] = dict()
+            for (name, labels), value in sorted(self._counters.items()):
+                if labels:
+                    counters.setdefault(name, dict())[",".join(f"{k}={v}" for (k, v) in labels)] = value
+                else:
+                    counters[name] = value
+            histograms = {
+                name: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "buckets": {str(bound): count for (bound, count) in zip(h.buckets, h.counts)},
+                }
+                for (name, h) in sorted(self._histograms.items())
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        # values are written in full: "{:g}" would round them to 6 significant digits.
+        lines: List[str] = list()
+        with self._lock:
+            declared = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                full_name = f"{self.PREFIX}_{name}"
+                if full_name not in declared:
+                    lines.append(f"# TYPE {full_name} counter")
+                    declared.add(full_name)
+                label_text = "{%s}" % ",".join(f'{k}="{v}"' for (k, v) in labels) if labels else ""
+                lines.append(f"{full_name}{label_text} {value}")
+            for name, h in sorted(self._histograms.items()):
+                full_name = f"{self.PREFIX}_{name}"
+                lines.append(f"# TYPE {full_name} histogram")
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append(f'{full_name}_bucket{{le="{bound:g}"}} {count}')
+                lines.append(f'{full_name}_bucket{{le="+Inf"}} {h.count}')
+                lines.append(f"{full_name}_sum {h.sum}")
+                lines.append(f"{full_name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_path: pathlib.Path) -> None:
+        # '.prom' files get the Prometheus text format (e.g. for the node exporter textfile collector), json otherwise.
+        if output_path.suffix == ".prom":
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2)
+        atomic_write_text(output_path, content)
+        logger.info(f"Metrics written to: {output_path}")
+
+
+metrics = Metrics()
+
+
+def slim_release(release_content: Dict) -> Dict:
+    release = {k: release_content.get(k) for k in RELEASE_FIELDS}
+    release["assets"] = [{k: a.get(k) for k in ASSET_FIELDS} for a in release_content.get("assets") or ()]
+    return release
+
+
+def iter_releases(text: str) -> Iterator[Dict]:
+    # The page is decoded at once by the (C) json decoder, which is faster than any incremental decoding written in
+    # python. Each release is slimmed down right after, and the full decoded release is dropped as soon as it is
+    # slimmed: only the fields used by the tool outlive the page.
+    release_contents = json.loads(text)
+    release_contents.reverse()
+    while release_contents:
+        yield slim_release(release_contents.pop())
+
+
+class ResponseCache:
+    # On-disk cache of response bodies, keyed by URL. The ETag and Last-Modified headers are kept along with the body
+    # so that later runs can issue conditional requests: a '304 Not Modified' answer is served from the cached body
+    # (and doesn't count against the GitHub rate limit). Without a cache directory, entries are only kept in memory
+    # (long-running processes).
+    def __init__(self, cache_dir: Optional[pathlib.Path]) -> None:
+        self.cache_dir = cache_dir
+        self._entries: Dict[str, Dict] = dict()
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, url: str) -> pathlib.Path:
+        return self.cache_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, url: str) -> Optional[Dict]:
+        if self.cache_dir is None:
+            return self._entries.get(url)
+        entry_path = self._entry_path(url)
+        if not entry_path.is_file():
+            return None
+        try:
+            with entry_path.open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry '{entry_path}': {e}")
+            return None
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict]) -> Dict[str, str]:
+        headers = dict()
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, headers: requests.structures.CaseInsensitiveDict, body: str) -> None:
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if not etag and not last_modified:
+            # nothing to validate the entry with on the next run.
+            return
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": dict(headers),
+            "body": body,
+        }
+        if self.cache_dir is None:
+            self._entries[url] = entry
+            return
+        # a concurrent reader never sees a partial entry.
+        atomic_write_text(self._entry_path(url), json.dumps(entry))
+
+
+class AssetClassifier:
+    # Classifies asset names into platform flags. Each name is only classified once: results are cached in memory
+    # and, if a cache file is loaded, across runs.
+    def __init__(self) -> None:
+        self._flags: Dict[str, int] = dict()
+        self._is_dirty = False
+
+    @staticmethod
+    def classify_name(name: str) -> int:
+        lower_name = name.lower()
+        is_android = lower_name.endswith("apk")
+        is_mac = name.endswith(".dmg")
+        flags = 0
+        if is_android:
+            flags |= ASSET_ANDROID
+        if "linux" in lower_name:
+            flags |= ASSET_LINUX
+        if is_mac:
+            flags |= ASSET_MAC
+        if "win" in lower_name:
+            flags |= ASSET_WINDOWS
+        if "curses" in lower_name:
+            flags |= ASSET_CURSES
+        if "tiles" in lower_name or is_android:
+            flags |= ASSET_TILES
+        if "x64" in lower_name or is_mac or is_android:
+            flags |= ASSET_64_BIT
+        else:
+            flags |= ASSET_32_BIT
+        return flags
+
+    def classify(self, name: str) -> int:
+        flags = self._flags.get(name)
+        if flags is None:
+            flags = self.classify_name(name)
+            self._flags[name] = flags
+            self._is_dirty = True
+        return flags
+
+    def load(self, cache_path: pathlib.Path) -> None:
+        if not cache_path.is_file():
+            return
+        with cache_path.open("r", encoding="utf-8") as f:
+            content = json.load(f)
+        # classification rules changed: the whole cache is stale.
+        if content.get("version") != CLASSIFIER_VERSION:
+            logger.info(f"Discarding asset classification cache '{cache_path}' (version mismatch).")
+            return
+        self._flags.update(content["flags"])
+
+    def save(self, cache_path: pathlib.Path) -> None:
+        if not self._is_dirty:
+            return
+        atomic_write_text(cache_path, json.dumps({"version": CLASSIFIER_VERSION, "flags": self._flags}))
+        self._is_dirty = False
+
+
+asset_classifier = AssetClassifier()
+
+
+def is_classified(flags: int) -> bool:
+    return bool(flags & ASSET_OS_MASK) and bool(flags & ASSET_UI_MASK)
+
+
+def flags_os_name(flags: int) -> Optional[str]:
+    if not is_classified(flags):
+        return None
+    for os_name, os_flag in OS_FLAGS.items():
+        if flags & os_flag:
+            return os_name
+    return None
+
+
+def flags_os_bucket(flags: int) -> str:
+    # per-OS bucket of an asset, as in `sum_os_flags()`: its OS name, or UNCLASSIFIED.
+    return flags_os_name(flags) or UNCLASSIFIED
+
+
+def sum_os_flags(flags_column: Iterable[int], download_counts: Iterable[int]) -> Dict[str, int]:
+    # per-OS download sums; assets which couldn't be classified end up in the UNCLASSIFIED bucket (only reported if
+    # there's any).
+    result = dict.fromkeys(OS_FLAGS.keys(), 0)
+    unclassified = 0
+    os_flags = list(OS_FLAGS.items())
+    for flags, download_count in zip(flags_column, download_counts):
+        if not is_classified(flags):
+            unclassified += download_count
+            continue
+        for os_name, os_flag in os_flags:
+            if flags & os_flag:
+                result[os_name] += download_count
+    if unclassified:
+        result[UNCLASSIFIED] = unclassified
+    return result
 
 
 class Asset:
-    def __init__(self, asset_content: Dict) -> None:
-        self._asset_content = asset_content
+    __slots__ = ["id", "name", "label", "download_count", "size", "url", "digest", "flags"]
 
-    def __getattr__(self, item: str):
-        return self._asset_content[item]
+    def __init__(self, asset_content: Dict) -> None:
+        self.id: int = asset_content["id"]
+        self.name: str = asset_content["name"]
+        self.label: Optional[str] = asset_content.get("label")
+        self.download_count: int = asset_content["download_count"]
+        self.size: Optional[int] = asset_content.get("size")
+        self.url: Optional[str] = asset_content.get("browser_download_url")
+        self.digest: Optional[str] = asset_content.get("digest")  # e.g. 'sha256:<hex digest>', recent assets only.
+        self.flags: int = asset_classifier.classify(self.name)
 
     def __str__(self) -> str:
         return f"{self.display_name}: {self.download_count}"
@@ -34,67 +392,84 @@ class Asset:
     def display_name(self) -> str:
         return self.label if self.label else self.name
 
+    @property
+    def os_name(self) -> Optional[str]:
+        return flags_os_name(self.flags)
+
+    @property
+    def is_classified(self) -> bool:
+        return is_classified(self.flags)
+
     @property
     def is_curses(self) -> bool:
-        return "curses" in self.name.lower()
+        return bool(self.flags & ASSET_CURSES)
 
     @property
     def is_tiles(self) -> bool:
-        if "tiles" in self.name.lower():
-            return True
-        if self.is_android:
-            return True
-        return False
+        return bool(self.flags & ASSET_TILES)
 
     @property
     def is_mac(self) -> bool:
-        return self.name.endswith(".dmg")
+        return bool(self.flags & ASSET_MAC)
 
     @property
     def is_windows(self) -> bool:
-        name = self.name.lower()
-        return "windows" in name or "win" in name
+        return bool(self.flags & ASSET_WINDOWS)
 
     @property
     def is_linux(self) -> bool:
-        return "linux" in self.name.lower()
+        return bool(self.flags & ASSET_LINUX)
 
     @property
     def is_android(self) -> bool:
-        return self.name.lower().endswith("apk")
+        return bool(self.flags & ASSET_ANDROID)
 
     @property
     def is_32_bit(self) -> bool:
-        if "x64" in self.name.lower():
-            return False
+        return bool(self.flags & ASSET_32_BIT)
 
-        if self.is_mac or self.is_android:
-            return False
+    @property
+    def is_64_bit(self) -> bool:
+        return bool(self.flags & ASSET_64_BIT)
 
-        return True
+    @property
+    def ui_name(self) -> Optional[str]:
+        if self.is_tiles:
+            return "tiles"
+        if self.is_curses:
+            return "curses"
+        return None
 
     @property
-    def is_64_bit(self) -> bool:
-        return not self.is_32_bit
+    def arch_name(self) -> str:
+        return "64-bit" if self.is_64_bit else "32-bit"
+
+
+def is_experimental(release_content: Dict) -> bool:
+    # CDDA experimental builds are published as pre-releases; older ones can only be told apart by their tag.
+    return bool(release_content.get("prerelease")) or "experimental" in release_content["tag_name"].lower()
 
 
 class Release:
+    __slots__ = ["id", "tag_name", "name", "published_at", "is_experimental", "assets"]
+
     def __init__(self, content_dict: Dict) -> None:
         logger.debug(f"[TAG] {content_dict['tag_name']}")
-        self._content_dict = content_dict
+        self.id: int = content_dict["id"]
+        self.tag_name: str = content_dict["tag_name"]
+        self.name: Optional[str] = content_dict.get("name")
+        self.published_at: Optional[str] = content_dict.get("published_at")
+        self.is_experimental: bool = is_experimental(content_dict)
         self.assets: List[Asset] = list()
         assets = content_dict.get("assets")
         if assets:
             for asset_content in assets:
                 asset = Asset(asset_content)
                 self.assets.append(asset)
-                assert asset.is_android or asset.is_linux or asset.is_mac or asset.is_windows
-                assert asset.is_curses or asset.is_tiles
+                if not asset.is_classified:
+                    logger.warning(f"Unclassified asset '{asset.name}' in release {self.tag_name}.")
             self.assets.sort(key=lambda a: a.display_name)
 
-    def __getattr__(self, item: str):
-        return self._content_dict[item]
-
     @property
     def total_downloads(self) -> int:
         if not self.assets:
@@ -103,26 +478,1083 @@ class Release:
         return sum([asset.download_count for asset in self.assets])
 
     def sum_os(self) -> Dict[str, int]:
-        f_names = {
-            "Android": "is_android",
-            "Linux": "is_linux",
-            "OSX": "is_mac",
-            "Windows": "is_windows"
-        }
+        return sum_os_flags((a.flags for a in self.assets), (a.download_count for a in self.assets))
+
+
+class ReleaseColumns:
+    # Columnar store for the full release history: releases and assets are kept in parallel arrays (ints in
+    # `array.array`, strings interned) instead of one object per release and per asset. Assets of release `i` are
+    # the slice `asset_start[i]:asset_start[i + 1]` of the asset columns.
+    def __init__(self) -> None:
+        self.release_ids = array.array("q")
+        self.tag_names: List[str] = list()
+        self.names: List[Optional[str]] = list()
+        self.published_at: List[Optional[str]] = list()
+        self.prereleases = array.array("B")  # experimental (1) or stable (0) release.
+        self.asset_start = array.array("q", [0])
+        self.asset_ids = array.array("q")
+        self.asset_display_names: List[str] = list()
+        self.download_counts = array.array("q")
+        self.asset_flags = array.array("B")
+
+    def __len__(self) -> int:
+        return len(self.release_ids)
+
+    def append(self, release_content: Dict) -> None:
+        self.release_ids.append(release_content["id"])
+        self.tag_names.append(release_content["tag_name"])
+        self.names.append(release_content.get("name"))
+        self.published_at.append(release_content.get("published_at"))
+        self.prereleases.append(is_experimental(release_content))
+        assets = sorted(release_content.get("assets") or (), key=lambda a: a.get("label") or a["name"])
+        for asset_content in assets:
+            flags = asset_classifier.classify(asset_content["name"])
+            if not is_classified(flags):
+                logger.warning(f"Unclassified asset '{asset_content['name']}' in release "
+                               f"{release_content['tag_name']}.")
+            self.asset_ids.append(asset_content["id"])
+            self.asset_display_names.append(sys.intern(asset_content.get("label") or asset_content["name"]))
+            self.download_counts.append(asset_content["download_count"])
+            self.asset_flags.append(flags)
+        self.asset_start.append(len(self.asset_ids))
+
+    def asset_range(self, release_index: int) -> range:
+        return range(self.asset_start[release_index], self.asset_start[release_index + 1])
+
+    def total_downloads(self, release_index: Optional[int] = None) -> int:
+        if release_index is None:
+            return sum(self.download_counts)
+        return sum(self.download_counts[self.asset_start[release_index]:self.asset_start[release_index + 1]])
+
+    def sum_os(self, release_index: Optional[int] = None) -> Dict[str, int]:
+        # per-OS sum for a single release, or for all the releases if `release_index` is None.
+        if release_index is None:
+            return sum_os_flags(self.asset_flags, self.download_counts)
+        start, end = self.asset_start[release_index], self.asset_start[release_index + 1]
+        return sum_os_flags(self.asset_flags[start:end], self.download_counts[start:end])
+
+    def iter_asset_rows(self) -> Iterator[Tuple]:
+        for release_index in range(len(self)):
+            for i in self.asset_range(release_index):
+                yield (self.release_ids[release_index], self.names[release_index], self.asset_ids[i],
+                       self.asset_display_names[i], flags_os_bucket(self.asset_flags[i]), self.download_counts[i])
+
+
+def iter_asset_rows(releases: Iterable[Release]) -> Iterator[Tuple]:
+    # (release id, release name, asset id, asset name, OS name or UNCLASSIFIED, download count) for each asset.
+    for release in releases:
+        for asset in release.assets:
+            yield (release.id, release.name, asset.id, asset.display_name, flags_os_bucket(asset.flags),
+                   asset.download_count)
+
+
+class DownloadAggregator:
+    # NumPy aggregation engine: one row per asset with integer codes for each dimension. A group-by over any set of
+    # dimensions is a single `bincount` over the combined dimension codes.
+    DIMENSIONS = ("os", "arch", "ui", "month", "channel", "release")
+    # named group-by presets; 'os' is the per-OS total of the text report.
+    PRESETS = {
+        "os": ("os",),
+        "os-arch": ("os", "arch"),
+        "os-ui": ("os", "ui"),
+        "platform": ("os", "arch", "ui"),
+        "month": ("month",),
+        "channel-month": ("channel", "month"),
+        "release": ("release",),
+    }
+
+    def __init__(self, release_names: List[str], published_at: List[Optional[str]], prereleases: List[bool],
+                 asset_release_index: Iterable[int], asset_flags: Iterable[int],
+                 download_counts: Iterable[int]) -> None:
+        if np is None:
+            raise RuntimeError("The aggregation engine requires numpy.")
+        self.downloads = np.asarray(download_counts, dtype=np.int64)
+        flags = np.asarray(asset_flags, dtype=np.uint8)
+        release_index = np.asarray(asset_release_index, dtype=np.int64)
+
+        self._codes: Dict[str, "np.ndarray"] = dict()
+        self._labels: Dict[str, List[str]] = dict()
+
+        # OS: first matching OS flag, unclassified assets in their own bucket.
+        os_names = list(OS_FLAGS.keys())
+        classified = ((flags & ASSET_OS_MASK) != 0) & ((flags & ASSET_UI_MASK) != 0)
+        conditions = [classified & ((flags & os_flag) != 0) for os_flag in OS_FLAGS.values()]
+        self._add_dimension("os", np.select(conditions, range(len(os_names)), default=len(os_names)),
+                            os_names + [UNCLASSIFIED])
+        self._add_dimension("arch", np.where((flags & ASSET_64_BIT) != 0, 1, 0), ["32-bit", "64-bit"])
+        self._add_dimension("ui", np.select([(flags & ASSET_TILES) != 0, (flags & ASSET_CURSES) != 0], [0, 1],
+                                            default=2), ["tiles", "curses", "unknown"])
+
+        # per-release dimensions, broadcast to the assets through their release index.
+        months = [date[:7] if date else "unknown" for date in published_at]
+        month_labels, month_codes = np.unique(np.asarray(months, dtype=str), return_inverse=True)
+        self._add_dimension("month", month_codes[release_index], month_labels.tolist())
+        channels = np.asarray(prereleases, dtype=np.int64)
+        self._add_dimension("channel", channels[release_index], ["stable", "experimental"])
+        self._add_dimension("release", release_index, list(release_names))
 
-        result = dict()
-        for os_name, func_name in f_names.items():
-            os_sum = sum([a.download_count for a in self.assets if getattr(a, func_name)])
-            result[os_name] = os_sum
+    def _add_dimension(self, name: str, codes, labels: List[str]) -> None:
+        self._codes[name] = np.asarray(codes, dtype=np.int64)
+        self._labels[name] = labels
 
+    @classmethod
+    def from_columns(cls, columns: ReleaseColumns) -> "DownloadAggregator":
+        counts = np.diff(np.asarray(columns.asset_start, dtype=np.int64))
+        asset_release_index = np.repeat(np.arange(len(columns)), counts)
+        return cls([name or tag for (name, tag) in zip(columns.names, columns.tag_names)], columns.published_at,
+                   list(columns.prereleases), asset_release_index, columns.asset_flags, columns.download_counts)
+
+    @classmethod
+    def from_releases(cls, releases: List[Release]) -> "DownloadAggregator":
+        asset_release_index = [i for (i, r) in enumerate(releases) for _ in r.assets]
+        assets = [a for r in releases for a in r.assets]
+        return cls([r.name or r.tag_name for r in releases], [r.published_at for r in releases],
+                   [r.is_experimental for r in releases], asset_release_index,
+                   [a.flags for a in assets], [a.download_count for a in assets])
+
+    @property
+    def total(self) -> int:
+        return int(self.downloads.sum())
+
+    def group_by(self, keys: Iterable[str]) -> List[Tuple[Tuple[str, ...], int]]:
+        # (group labels, downloads) for every non empty group, most downloaded first.
+        keys = tuple(keys)
+        unknown_keys = [k for k in keys if k not in self.DIMENSIONS]
+        if unknown_keys:
+            raise ValueError(f"Unknown group-by key(s): {unknown_keys}; expected: {self.DIMENSIONS}")
+        if not keys or not len(self.downloads):
+            return [((), self.total)] if not keys else []
+
+        dims = tuple(len(self._labels[k]) for k in keys)
+        flat_codes = np.ravel_multi_index(tuple(self._codes[k] for k in keys), dims)
+        sums = np.bincount(flat_codes, weights=self.downloads, minlength=int(np.prod(dims)))
+        sizes = np.bincount(flat_codes, minlength=int(np.prod(dims)))
+        groups = np.flatnonzero(sizes)
+        groups = groups[np.argsort(-sums[groups], kind="stable")]
+        result = list()
+        for group, codes in zip(groups, zip(*np.unravel_index(groups, dims))):
+            labels = tuple(self._labels[k][c] for (k, c) in zip(keys, codes))
+            result.append((labels, int(sums[group])))
         return result
 
+    def top(self, keys: Iterable[str], n: int) -> List[Tuple[Tuple[str, ...], int]]:
+        return self.group_by(keys)[:n]
+
+    def percentiles(self, keys: Iterable[str], percentiles: Iterable[float]) -> Dict[float, float]:
+        # distribution of the per-group downloads (e.g. per release).
+        totals = np.asarray([downloads for (_, downloads) in self.group_by(keys)], dtype=np.float64)
+        if not len(totals):
+            return dict()
+        percentiles = list(percentiles)
+        return dict(zip(percentiles, (float(v) for v in np.percentile(totals, percentiles))))
+
+
+class ReleaseIndex:
+    # Query indexes over the loaded releases, built once: tag -> release, releases sorted by date (range queries
+    # are two bisections) and releases sorted by downloads (top N is a slice). Top assets use a heap over the
+    # (possibly date restricted) asset rows.
+    def __init__(self, tag_names: List[str], names: List[Optional[str]], published_at: List[Optional[str]],
+                 asset_start: List[int], asset_names: List[str], asset_flags: List[int],
+                 download_counts: List[int]) -> None:
+        self.tag_names = tag_names
+        self.names = names
+        self.published_at = published_at
+        self.asset_start = asset_start
+        self.asset_names = asset_names
+        self.asset_flags = asset_flags
+        self.download_counts = download_counts
+        self.release_totals = [sum(download_counts[asset_start[i]:asset_start[i + 1]]) for i in range(len(tag_names))]
+
+        self._by_tag = {tag: i for (i, tag) in enumerate(tag_names)}
+        # releases without a publication date (drafts) are left out of the date index.
+        dated = sorted((date, i) for (i, date) in enumerate(published_at) if date)
+        self._dates = [date for (date, _) in dated]
+        self._date_order = [i for (_, i) in dated]
+        self._download_order = sorted(range(len(tag_names)), key=lambda i: -self.release_totals[i])
+        # assets: release of each asset, OS of each asset (classified once), and the assets by downloads, overall and
+        # per OS.
+        self._asset_release = [i for i in range(len(tag_names)) for _ in range(asset_start[i], asset_start[i + 1])]
+        self._asset_os = [flags_os_bucket(flags) for flags in asset_flags]
+        self._asset_download_order = sorted(range(len(asset_names)), key=lambda j: -download_counts[j])
+        self._os_asset_download_order: Dict[str, List[int]] = {os_name: list() for os_name in EXPORT_OS_COLUMNS}
+        for j in self._asset_download_order:
+            self._os_asset_download_order[self._asset_os[j]].append(j)
+
+    def __len__(self) -> int:
+        return len(self.tag_names)
+
+    @classmethod
+    def from_columns(cls, columns: ReleaseColumns) -> "ReleaseIndex":
+        return cls(columns.tag_names, columns.names, columns.published_at, columns.asset_start,
+                   columns.asset_display_names, columns.asset_flags, columns.download_counts)
+
+    @classmethod
+    def from_releases(cls, releases: List[Release]) -> "ReleaseIndex":
+        asset_start = [0]
+        for release in releases:
+            asset_start.append(asset_start[-1] + len(release.assets))
+        assets = [a for r in releases for a in r.assets]
+        return cls([r.tag_name for r in releases], [r.name for r in releases], [r.published_at for r in releases],
+                   asset_start, [a.display_name for a in assets], [a.flags for a in assets],
+                   [a.download_count for a in assets])
+
+    def find_tag(self, tag_name: str) -> Optional[int]:
+        return self._by_tag.get(tag_name)
+
+    def date_range(self, since: Optional[str] = None, until: Optional[str] = None) -> List[int]:
+        # releases published in [since, until], oldest first; bounds are ISO 8601 UTC strings.
+        start = bisect.bisect_left(self._dates, since) if since else 0
+        end = bisect.bisect_right(self._dates, until) if until else len(self._dates)
+        return self._date_order[start:end]
+
+    def top_releases(self, n: int, since: Optional[str] = None, until: Optional[str] = None) -> List[int]:
+        if since is None and until is None:
+            return self._download_order[:n]
+        return heapq.nlargest(n, self.date_range(since, until), key=self.release_totals.__getitem__)
+
+    def top_assets(self, n: int, since: Optional[str] = None, until: Optional[str] = None,
+                   os_name: Optional[str] = None) -> List[Tuple[int, int]]:
+        # (release index, asset index) of the `n` most downloaded assets, optionally for a single OS (or
+        # `UNCLASSIFIED`).
+        if since is None and until is None:
+            order = self._asset_download_order if os_name is None else self._os_asset_download_order[os_name]
+            return [(self._asset_release[j], j) for j in order[:n]]
+        releases = self.date_range(since, until)
+        rows = ((i, j) for i in releases for j in range(self.asset_start[i], self.asset_start[i + 1])
+                if os_name is None or self._asset_os[j] == os_name)
+        return heapq.nlargest(n, rows, key=lambda row: self.download_counts[row[1]])
+
+    def release_label(self, i: int) -> str:
+        return self.names[i] or self.tag_names[i]
+
+
+class ChunkedWriter:
+    # Accumulates small writes and hands them to the underlying stream in large chunks.
+    def __init__(self, stream: IO, chunk_size: int = OUTPUT_CHUNK_SIZE) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._parts: List = list()
+        self._size = 0
+
+    def write(self, data) -> None:
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._parts:
+            empty = b"" if isinstance(self._parts[0], bytes) else ""
+            self._stream.write(empty.join(self._parts))
+            self._parts.clear()
+            self._size = 0
+        self._stream.flush()
+
+
+def release_record(release: Release) -> Dict:
+    record = {
+        "id": release.id,
+        "tag_name": release.tag_name,
+        "name": release.name,
+        "published_at": release.published_at,
+        "experimental": release.is_experimental,
+        "total_downloads": release.total_downloads,
+    }
+    sums = release.sum_os()
+    for os_name in EXPORT_OS_COLUMNS:
+        record[os_name] = sums.get(os_name, 0)
+    return record
+
+
+def iter_asset_records(release: Release) -> Iterator[Dict]:
+    for asset in release.assets:
+        yield {
+            "release_id": release.id,
+            "tag_name": release.tag_name,
+            "asset_id": asset.id,
+            "name": asset.name,
+            "display_name": asset.display_name,
+            "download_count": asset.download_count,
+            "os": flags_os_bucket(asset.flags),
+            "ui": asset.ui_name,
+            "arch": asset.arch_name,
+        }
+
+
+class Exporter(abc.ABC):
+    # Streams one record per release ('release' level) or per asset ('asset' level) to a file, as the releases are
+    # parsed. Subclasses implement `_write_records()`.
+    LEVELS = ("release", "asset")
+
+    def __init__(self, output_path: pathlib.Path, level: str = "release") -> None:
+        if level not in self.LEVELS:
+            raise ValueError(f"Unknown export level: '{level}'; expected one of: {self.LEVELS}")
+        self.output_path = output_path
+        self.level = level
+        self.num_records = 0
+
+    def __enter__(self) -> "Exporter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def write_release(self, release: Release) -> None:
+        records = [release_record(release)] if self.level == "release" else list(iter_asset_records(release))
+        self._write_records(records)
+        self.num_records += len(records)
+
+    @abc.abstractmethod
+    def _write_records(self, records: List[Dict]) -> None:
+        pass
+
+    def close(self) -> None:
+        logger.info(f"Exported {self.num_records} {self.level} records to '{self.output_path}'.")
+
+    @staticmethod
+    def create(export_format: str, output_path: pathlib.Path, level: str) -> "Exporter":
+        exporters = {
+            "jsonl": JsonLinesExporter,
+            "csv": CsvExporter,
+            "parquet": ParquetExporter,
+        }
+        return exporters[export_format](output_path, level)
+
+
+class JsonLinesExporter(Exporter):
+    def __init__(self, output_path: pathlib.Path, level: str = "release") -> None:
+        super().__init__(output_path, level)
+        self._file = output_path.open("w", encoding="utf-8", newline="\n")
+        self._writer = ChunkedWriter(self._file)
+
+    def _write_records(self, records: List[Dict]) -> None:
+        for record in records:
+            self._writer.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self) -> None:
+        self._writer.flush()
+        self._file.close()
+        super().close()
+
+
+class CsvExporter(Exporter):
+    def __init__(self, output_path: pathlib.Path, level: str = "release") -> None:
+        super().__init__(output_path, level)
+        self._file = output_path.open("w", encoding="utf-8", newline="")
+        self._writer = ChunkedWriter(self._file)
+        self._csv_writer: Optional[csv.DictWriter] = None
+
+    def _write_records(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        if self._csv_writer is None:
+            self._csv_writer = csv.DictWriter(self._writer, fieldnames=list(records[0].keys()))
+            self._csv_writer.writeheader()
+        self._csv_writer.writerows(records)
+
+    def close(self) -> None:
+        self._writer.flush()
+        self._file.close()
+        super().close()
+
+
+class ParquetExporter(Exporter):
+    # records are buffered column-wise and written as one parquet row group every `ROW_GROUP_SIZE` records.
+    ROW_GROUP_SIZE = 64 * 1024
+
+    def __init__(self, output_path: pathlib.Path, level: str = "release") -> None:
+        if pa is None:
+            raise RuntimeError("The parquet exporter requires pyarrow.")
+        super().__init__(output_path, level)
+        self._schema = self.make_schema(level)
+        self._columns: Dict[str, List] = dict()
+        self._num_buffered = 0
+        self._parquet_writer = None
+
+    @staticmethod
+    def make_schema(level: str) -> "pa.Schema":
+        # explicit column types: inferred from the first row group, a column holding only None values there (e.g. the
+        # 'ui' of unclassified assets, or a release name) would get the 'null' type, and later row groups would fail.
+        if level == "release":
+            fields = [("id", pa.int64()), ("tag_name", pa.string()), ("name", pa.string()),
+                      ("published_at", pa.string()), ("experimental", pa.bool_()), ("total_downloads", pa.int64())]
+            fields += [(os_name, pa.int64()) for os_name in EXPORT_OS_COLUMNS]
+        else:
+            fields = [("release_id", pa.int64()), ("tag_name", pa.string()), ("asset_id", pa.int64()),
+                      ("name", pa.string()), ("display_name", pa.string()), ("download_count", pa.int64()),
+                      ("os", pa.string()), ("ui", pa.string()), ("arch", pa.string())]
+        return pa.schema(fields)
+
+    def _write_records(self, records: List[Dict]) -> None:
+        for record in records:
+            for k, v in record.items():
+                self._columns.setdefault(k, list()).append(v)
+        self._num_buffered += len(records)
+        if self._num_buffered >= self.ROW_GROUP_SIZE:
+            self._flush_row_group()
+
+    def _flush_row_group(self) -> None:
+        if not self._num_buffered:
+            return
+        table = pa.Table.from_pydict(self._columns, schema=self._schema)
+        if self._parquet_writer is None:
+            self._parquet_writer = pa_parquet.ParquetWriter(str(self.output_path), self._schema)
+        self._parquet_writer.write_table(table)
+        self._columns = dict()
+        self._num_buffered = 0
+
+    def close(self) -> None:
+        self._flush_row_group()
+        if self._parquet_writer is None:
+            # no record: still a valid (empty) file.
+            self._parquet_writer = pa_parquet.ParquetWriter(str(self.output_path), self._schema)
+        self._parquet_writer.close()
+        super().close()
+
+
+class ReleaseStore:
+    # Local store of the raw release records, keyed by release id. Used by the incremental sync so that only the
+    # newest pages need to be fetched on each run.
+    def __init__(self, store_path: pathlib.Path) -> None:
+        self.store_path = store_path
+        self._records: Dict[int, Dict] = dict()
+        if self.store_path.is_file():
+            with self.store_path.open("r", encoding="utf-8") as f:
+                self._records = {int(k): v for (k, v) in json.load(f).items()}
+        logger.info(f"Release store '{self.store_path}' holds {len(self._records)} releases.")
+
+    def __contains__(self, release_id: int) -> bool:
+        return release_id in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def update(self, release_content: Dict) -> None:
+        self._records[release_content["id"]] = release_content
+
+    def records(self) -> List[Dict]:
+        # newest first, as returned by the API. ISO 8601 UTC strings sort chronologically; drafts have no date.
+        return sorted(self._records.values(), key=lambda r: r.get("published_at") or "", reverse=True)
+
+    def save(self) -> None:
+        atomic_write_text(self.store_path, json.dumps(self._records))
+
+
+class SnapshotStore:
+    # SQLite time-series of the asset download counts: each run records one snapshot. Download deltas between two
+    # snapshots are computed with range scans over the (snapshot_id, asset_id) primary key, so the cost of a query
+    # doesn't depend on the number of snapshots in between.
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS snapshots (
+            snapshot_id INTEGER PRIMARY KEY,
+            taken_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS snapshots_taken_at ON snapshots (taken_at);
+        CREATE TABLE IF NOT EXISTS assets (
+            asset_id INTEGER PRIMARY KEY,
+            release_id INTEGER NOT NULL,
+            release_name TEXT,
+            asset_name TEXT NOT NULL,
+            os_name TEXT
+        );
+        CREATE TABLE IF NOT EXISTS downloads (
+            snapshot_id INTEGER NOT NULL,
+            asset_id INTEGER NOT NULL,
+            release_id INTEGER NOT NULL,
+            download_count INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_id, asset_id)
+        ) WITHOUT ROWID;
+    '''
+
+    def __init__(self, db_path: pathlib.Path) -> None:
+        self.db_path = db_path
+        self._connection = sqlite3.connect(str(db_path))
+        self._connection.executescript(self.SCHEMA)
+
+    def __enter__(self) -> "SnapshotStore":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @staticmethod
+    def now() -> str:
+        return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def record(self, asset_rows: Iterable[Tuple], taken_at: Optional[str] = None) -> int:
+        # `asset_rows` as given by `iter_asset_rows()` or `ReleaseColumns.iter_asset_rows()`.
+        taken_at = taken_at or self.now()
+        asset_rows = list(asset_rows)
+        with self._connection:
+            cursor = self._connection.execute("INSERT INTO snapshots (taken_at) VALUES (?)", (taken_at,))
+            snapshot_id = cursor.lastrowid
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO assets (asset_id, release_id, release_name, asset_name, os_name) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((asset_id, release_id, release_name, asset_name, os_name)
+                 for (release_id, release_name, asset_id, asset_name, os_name, _) in asset_rows))
+            self._connection.executemany(
+                "INSERT INTO downloads (snapshot_id, asset_id, release_id, download_count) VALUES (?, ?, ?, ?)",
+                ((snapshot_id, asset_id, release_id, download_count)
+                 for (release_id, _, asset_id, _, _, download_count) in asset_rows))
+        logger.info(f"Recorded snapshot #{snapshot_id} at {taken_at}.")
+        return snapshot_id
+
+    def find_snapshots(self, since: Optional[str], until: Optional[str]) -> Optional[Tuple[Tuple, Tuple]]:
+        # first snapshot at or after `since` and last snapshot at or before `until`.
+        start = self._connection.execute(
+            "SELECT snapshot_id, taken_at FROM snapshots WHERE taken_at >= ? ORDER BY taken_at LIMIT 1",
+            (since or "",)).fetchone()
+        end = self._connection.execute(
+            "SELECT snapshot_id, taken_at FROM snapshots WHERE taken_at <= ? ORDER BY taken_at DESC LIMIT 1",
+            (until or "9999",)).fetchone()
+        if start is None or end is None or start[1] >= end[1]:
+            return None
+        return start, end
+
+    def deltas(self, start_id: int, end_id: int, group_by: str) -> List[Tuple[str, int]]:
+        # assets absent from the first snapshot (new releases) count from 0. Older databases have NULL for the
+        # unclassified assets.
+        columns = {
+            "os": f"COALESCE(a.os_name, '{UNCLASSIFIED}')",
+            "release": "a.release_name",
+        }
+        column = columns[group_by]
+        query = f'''
+            SELECT {column}, SUM(e.download_count - COALESCE(s.download_count, 0)) AS delta
+            FROM downloads AS e
+            JOIN assets AS a ON a.asset_id = e.asset_id
+            LEFT JOIN downloads AS s ON s.snapshot_id = ? AND s.asset_id = e.asset_id
+            WHERE e.snapshot_id = ?
+            GROUP BY {column}
+            ORDER BY delta DESC
+        '''
+        return self._connection.execute(query, (start_id, end_id)).fetchall()
+
+
+class PageFetchError(RuntimeError):
+    def __init__(self, msg: str, status_code: Optional[int] = None,
+                 headers: Optional[requests.structures.CaseInsensitiveDict] = None) -> None:
+        super().__init__(msg)
+        self.status_code = status_code
+        self.headers = headers if headers is not None else requests.structures.CaseInsensitiveDict()
+
+    @property
+    def is_transient(self) -> bool:
+        # 403 is only worth retrying when it's a rate limit answer (not a permission issue).
+        if self.status_code is None or self.status_code in RETRY_STATUSES:
+            return True
+        if self.status_code == 403:
+            return self.headers.get("x-ratelimit-remaining") == "0" or "retry-after" in self.headers
+        return False
+
+
+class MappedFile(io.RawIOBase):
+    # Minimal file object over a memory map (`mmap.mmap` isn't seekable() before python 3.13, which zipfile needs).
+    def __init__(self, mapped: mmap.mmap) -> None:
+        super().__init__()
+        self._mmap = mapped
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._mmap.read(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._mmap.seek(offset, whence)
+        return self._mmap.tell()
+
+    def tell(self) -> int:
+        return self._mmap.tell()
+
+
+class PageArchive:
+    # Compressed (zip) archive of raw release pages and their response headers, keyed by URL.
+    # - mode 'w' (record): `add()` is called for each page fetched by `PageLoader._get_page_content`.
+    # - mode 'r' (replay): pages are served by `get()` instead of the network; the archive file is memory-mapped
+    #   when possible.
+    INDEX_NAME = "index.json"
+
+    def __init__(self, archive_path: pathlib.Path, mode: str = "r") -> None:
+        if mode not in ("r", "w"):
+            raise ValueError(f"Unknown archive mode: '{mode}'")
+        self.archive_path = archive_path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._index: Dict[str, str] = dict()  # url -> entry name.
+        self._file: Optional[IO] = None
+        self._mmap: Optional[mmap.mmap] = None
+        if mode == "w":
+            self._zip_file = zipfile.ZipFile(str(archive_path), "w", compression=zipfile.ZIP_DEFLATED)
+            return
+
+        self._file = archive_path.open("rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Can't memory-map '{archive_path}' ({e}); reading it from the file.")
+        self._zip_file = zipfile.ZipFile(MappedFile(self._mmap) if self._mmap is not None else self._file, "r")
+        self._index = json.loads(self._zip_file.read(self.INDEX_NAME))
+        logger.info(f"Replaying {len(self._index)} pages from '{archive_path}'.")
+
+    def __enter__(self) -> "PageArchive":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def is_replay(self) -> bool:
+        return self.mode == "r"
+
+    def add(self, url: str, headers: Dict, body: str) -> None:
+        with self._lock:
+            entry_name = self._index.get(url) or f"pages/{len(self._index):06d}"
+            self._index[url] = entry_name
+            self._zip_file.writestr(f"{entry_name}.json", body)
+            self._zip_file.writestr(f"{entry_name}.headers.json", json.dumps(dict(headers)))
+
+    def get(self, url: str) -> Tuple[str, requests.structures.CaseInsensitiveDict]:
+        entry_name = self._index.get(url)
+        if entry_name is None:
+            raise PageFetchError(f"No archived page for url: {url}", 404)
+        # ZipFile reads aren't thread-safe on a shared file object.
+        with self._lock:
+            body = self._zip_file.read(f"{entry_name}.json").decode("utf-8")
+            headers = json.loads(self._zip_file.read(f"{entry_name}.headers.json"))
+        return body, requests.structures.CaseInsensitiveDict(headers)
+
+    def close(self) -> None:
+        if self.mode == "w":
+            with self._lock:
+                self._zip_file.writestr(self.INDEX_NAME, json.dumps(self._index))
+            logger.info(f"Recorded {len(self._index)} pages to '{self.archive_path}'.")
+        self._zip_file.close()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class RequestScheduler:
+    # Runs requests on a bounded thread pool while tracking the GitHub rate limit budget from the response headers.
+    # Concurrency is lowered when the budget runs low, and held off until the reset time when it's exhausted.
+    # Transient errors are retried with a jittered exponential backoff (or the delay given by the server); only the
+    # failed requests are retried, results already fetched are kept.
+    def __init__(self, workers: int = 1, max_retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+                 low_budget: int = 50) -> None:
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.low_budget = low_budget
+        self._lock = threading.Lock()
+        self._remaining: Optional[int] = None
+        self._reset_at: Optional[float] = None  # epoch time.
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def __enter__(self) -> "RequestScheduler":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def update_budget(self, headers: Dict) -> None:
+        remaining = headers.get("x-ratelimit-remaining")
+        reset_at = headers.get("x-ratelimit-reset")
+        with self._lock:
+            if remaining is not None:
+                self._remaining = int(remaining)
+            if reset_at is not None:
+                self._reset_at = float(reset_at)
+
+    @property
+    def concurrency(self) -> int:
+        with self._lock:
+            remaining, reset_at = self._remaining, self._reset_at
+        if remaining is None or remaining >= self.low_budget:
+            return self.workers
+        if remaining == 0:
+            if reset_at is not None and reset_at > time.time():
+                return 0
+            # past the reset time: the budget is back.
+            return self.workers
+        return max(1, self.workers * remaining // self.low_budget)
+
+    def _budget_wait_time(self) -> float:
+        with self._lock:
+            reset_at = self._reset_at
+        return max(0.0, reset_at - time.time()) if reset_at is not None else self.backoff
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        if isinstance(error, PageFetchError):
+            retry_after = error.headers.get("retry-after")
+            if retry_after is not None and retry_after.isdigit():
+                return float(retry_after)
+            if error.headers.get("x-ratelimit-remaining") == "0":
+                reset_at = error.headers.get("x-ratelimit-reset")
+                if reset_at is not None:
+                    return max(0.0, float(reset_at) - time.time())
+        # "full jitter" exponential backoff.
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, fn: Callable, item):
+        for _, result in self.map(fn, [item]):
+            return result
+
+    def map(self, fn: Callable, items: List) -> Iterator[Tuple]:
+        # Yields (item, fn(item)) in the order of `items`, as soon as each result and all the previous ones are done.
+        with self._lock:
+            # the scheduler may be shared by several loaders running in their own threads (batch mode).
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+
+        results: Dict[int, object] = dict()
+        attempts: Dict[int, int] = dict()
+        pending: List[Tuple[float, int]] = [(0.0, i) for i in range(len(items))]  # (not before, item index).
+        in_flight: Dict[concurrent.futures.Future, int] = dict()
+        next_index = 0
+        while next_index < len(items):
+            now = time.monotonic()
+            pending.sort()
+            concurrency = self.concurrency
+            while pending and pending[0][0] <= now and len(in_flight) < concurrency:
+                _, index = pending.pop(0)
+                in_flight[self._executor.submit(fn, items[index])] = index
+
+            if not in_flight:
+                # nothing running: either waiting on a retry delay or on the rate limit reset.
+                wait_time = pending[0][0] - now if concurrency else self._budget_wait_time()
+                logger.info(f"Waiting {wait_time:.1f} seconds before the next request.")
+                time.sleep(max(0.0, wait_time))
+                continue
+
+            timeout = max(0.0, pending[0][0] - now) if pending and len(in_flight) < concurrency else None
+            done, _ = concurrent.futures.wait(in_flight, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                try:
+                    results[index] = future.result()
+                except (PageFetchError, requests.RequestException) as e:
+                    if isinstance(e, PageFetchError) and not e.is_transient:
+                        raise
+                    attempt = attempts.get(index, 0)
+                    if attempt >= self.max_retries:
+                        logger.error(f"Giving up on '{items[index]}' after {attempt + 1} attempts.")
+                        raise
+                    attempts[index] = attempt + 1
+                    metrics.inc("retries_total")
+                    delay = self._retry_delay(e, attempt)
+                    logger.warning(f"{e}; retry #{attempt + 1} in {delay:.1f} seconds.")
+                    pending.append((time.monotonic() + delay, index))
+
+            while next_index in results:
+                yield items[next_index], results.pop(next_index)
+                next_index += 1
+
+
+class ReleasePoller:
+    # Resident poller: keeps the download counts of every known release in memory and polls the first release page
+    # with conditional requests. Only the changes are emitted, as json lines: new releases and per-asset download
+    # count deltas.
+    def __init__(self, page_loader: "PageLoader", output: IO, interval: float = 300.0) -> None:
+        self.page_loader = page_loader
+        self.interval = interval
+        self._writer = ChunkedWriter(output)
+        self._download_counts: Dict[int, Dict[int, int]] = dict()  # release id -> {asset id -> download count}
+        self._last_page: Optional[str] = None
+
+    def track_release(self, release: Release) -> None:
+        self._download_counts[release.id] = {asset.id: asset.download_count for asset in release.assets}
+
+    @property
+    def num_releases(self) -> int:
+        return len(self._download_counts)
+
+    def _emit(self, event: Dict) -> None:
+        self._writer.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def poll_once(self) -> int:
+        page = self.page_loader.get_first_page_content()
+        # unchanged page (usually a '304 Not Modified' served from the cache): nothing to parse.
+        if page == self._last_page:
+            return 0
+        self._last_page = page
+
+        now = SnapshotStore.now()
+        num_events = 0
+        for release_content in iter_releases(page):
+            known_counts = self._download_counts.get(release_content["id"])
+            counts = {a["id"]: a["download_count"] for a in release_content["assets"]}
+            if known_counts is None:
+                self._emit({
+                    "time": now,
+                    "event": "new_release",
+                    "release_id": release_content["id"],
+                    "tag_name": release_content["tag_name"],
+                    "published_at": release_content["published_at"],
+                    "download_count": sum(counts.values()),
+                })
+                num_events += 1
+                known_counts = dict()
+            for asset_content in release_content["assets"]:
+                previous = known_counts.get(asset_content["id"], 0)
+                delta = asset_content["download_count"] - previous
+                if delta:
+                    self._emit({
+                        "time": now,
+                        "event": "downloads",
+                        "release_id": release_content["id"],
+                        "tag_name": release_content["tag_name"],
+                        "asset_id": asset_content["id"],
+                        "name": asset_content["name"],
+                        "previous": previous,
+                        "current": asset_content["download_count"],
+                        "delta": delta,
+                    })
+                    num_events += 1
+            self._download_counts[release_content["id"]] = counts
+        self._writer.flush()
+        return num_events
+
+    def run(self, max_polls: Optional[int] = None) -> None:
+        num_polls = 0
+        while max_polls is None or num_polls < max_polls:
+            if num_polls:
+                time.sleep(self.interval)
+            num_polls += 1
+            try:
+                num_events = self.poll_once()
+            except (PageFetchError, requests.RequestException) as e:
+                # keep running: the next poll may succeed.
+                logger.error(f"Poll #{num_polls} failed: {e}")
+                continue
+            logger.debug(f"Poll #{num_polls}: {num_events} events.")
+
+
+class MirrorItem(NamedTuple):
+    release: Release
+    asset: Asset
+
+    def __str__(self) -> str:
+        return f"{self.release.tag_name}/{self.asset.name}"
+
+
+class AssetMirror:
+    # Local mirror of release assets: `<mirror dir>/<tag name>/<asset name>`, each file with a json sidecar holding
+    # the ETag, size and digest of the downloaded file. Downloads are streamed to a '.part' file, resumed with a
+    # Range request after an interruption, checked against the size and digest given by the API, then renamed.
+    # A file is skipped when its size matches the API and the server answers 'Not Modified' to its ETag.
+    PART_SUFFIX = ".part"
+    META_SUFFIX = ".meta.json"
+
+    def __init__(self, mirror_dir: pathlib.Path, session: Optional[requests.Session] = None) -> None:
+        self.mirror_dir = mirror_dir
+        self._session = session if session is not None else create_session()
+
+    def asset_path(self, release: Release, asset: Asset) -> pathlib.Path:
+        return self.mirror_dir / release.tag_name / asset.name
+
+    @staticmethod
+    def _load_meta(meta_path: pathlib.Path) -> Dict:
+        try:
+            with meta_path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    @staticmethod
+    def _new_hash(asset: Asset):
+        # the API digest is '<algorithm>:<hex digest>' (e.g. 'sha256:...'); older assets don't have one.
+        algorithm = asset.digest.partition(":")[0] if asset.digest else "sha256"
+        return hashlib.new(algorithm)
+
+    def download(self, item: MirrorItem) -> str:
+        # returns 'skipped', 'resumed' or 'downloaded'.
+        release, asset = item
+        path = self.asset_path(release, asset)
+        part_path = path.with_name(path.name + self.PART_SUFFIX)
+        meta_path = path.with_name(path.name + self.META_SUFFIX)
+        meta = self._load_meta(meta_path)
+        # no transfer encoding, or the byte ranges would apply to the compressed content.
+        headers = {"Accept-Encoding": "identity"}
+
+        is_complete = path.is_file() and meta.get("etag") and path.stat().st_size == asset.size
+        offset = part_path.stat().st_size if not is_complete and part_path.is_file() else 0
+        if offset and offset == asset.size:
+            # the previous run stopped after the last chunk but before the rename: nothing left to request.
+            file_hash = self._new_hash(asset)
+            with part_path.open("rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    file_hash.update(chunk)
+            self._complete(asset, path, part_path, meta_path, file_hash, meta.get("etag"))
+            return "resumed"
+        if is_complete:
+            headers["If-None-Match"] = meta["etag"]
+        elif offset and meta.get("etag"):
+            # the range is only honored if the file is still the one the partial download started from.
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = meta["etag"]
+        else:
+            offset = 0
+
+        with self._session.get(asset.url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            metrics.inc("downloads_total", status=response.status_code)
+            if response.status_code == 304:
+                logger.debug(f"Up to date: {path}")
+                return "skipped"
+            if response.status_code == 416 and offset:
+                # the partial file isn't a prefix of the remote one (e.g. it's longer): start again from 0.
+                logger.warning(f"Range not satisfiable, restarting the download of: {path}")
+                part_path.unlink()
+                return self.download(item)
+            if response.status_code not in (200, 206):
+                raise PageFetchError(f"Error downloading asset: {response.status_code} - url: {asset.url}",
+                                     response.status_code, response.headers)
+            if response.status_code == 200:
+                offset = 0
+            etag = response.headers.get("etag")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # the sidecar is written first: it holds the ETag needed to resume the partial file.
+            self._write_meta(meta_path, {"etag": etag, "size": asset.size, "digest": asset.digest})
+
+            file_hash = self._new_hash(asset)
+            with part_path.open("r+b" if offset else "wb") as f:
+                if offset:
+                    # resumed download: the digest covers the bytes already on disk too.
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        file_hash.update(chunk)
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    file_hash.update(chunk)
+                    metrics.inc("download_bytes_total", len(chunk))
+
+        self._complete(asset, path, part_path, meta_path, file_hash, etag)
+        return "resumed" if offset else "downloaded"
+
+    def _complete(self, asset: Asset, path: pathlib.Path, part_path: pathlib.Path, meta_path: pathlib.Path,
+                  file_hash, etag: Optional[str]) -> None:
+        self._verify(asset, part_path, file_hash)
+        os.replace(part_path, path)
+        self._write_meta(meta_path, {"etag": etag, "size": asset.size, "digest": asset.digest})
+        logger.info(f"Downloaded: {path}")
+
+    @staticmethod
+    def _verify(asset: Asset, part_path: pathlib.Path, file_hash) -> None:
+        size = part_path.stat().st_size
+        error = None
+        if asset.size is not None and size != asset.size:
+            error = f"size is {size}, expected {asset.size}"
+        elif asset.digest and f"{file_hash.name}:{file_hash.hexdigest()}" != asset.digest:
+            error = f"digest is {file_hash.name}:{file_hash.hexdigest()}, expected {asset.digest}"
+        if error is not None:
+            # the partial file is unusable: the retry starts from scratch.
+            part_path.unlink()
+            raise PageFetchError(f"Corrupted download of '{asset.name}': {error}")
+
+    @staticmethod
+    def _write_meta(meta_path: pathlib.Path, meta: Dict) -> None:
+        atomic_write_text(meta_path, json.dumps(meta))
+
+    def _download_item(self, item: MirrorItem) -> str:
+        # a permanent error (e.g. a removed asset) only fails its own item; transient errors go back to the scheduler.
+        try:
+            return self.download(item)
+        except PageFetchError as e:
+            if e.is_transient:
+                raise
+            logger.error(f"Failed to mirror '{item}': {e}")
+            return "failed"
+
+    def mirror(self, items: List[MirrorItem], scheduler: RequestScheduler) -> Dict[str, int]:
+        # downloads run on the scheduler pool: bounded concurrency, and transient errors (including a corrupted
+        # download) are retried; an interrupted download resumes from its partial file. Results are counted per
+        # outcome: 'downloaded', 'resumed', 'skipped' or 'failed'.
+        results: Dict[str, int] = dict()
+        for _, result in scheduler.map(self._download_item, items):
+            results[result] = results.get(result, 0) + 1
+        return results
+
+
+def asset_matches(asset: Asset, os_names: Optional[List[str]] = None, ui_names: Optional[List[str]] = None,
+                  arch_names: Optional[List[str]] = None) -> bool:
+    # asset filters on the platform classification; an empty filter matches everything.
+    return ((not os_names or asset.os_name in os_names) and (not ui_names or asset.ui_name in ui_names)
+            and (not arch_names or asset.arch_name in arch_names))
+
+
+class ReleaseFilter:
+    # Release filters applied while the pages are parsed. Dates are kept as ISO 8601 UTC strings (the API format):
+    # they compare chronologically as plain strings, so no date is parsed per release.
+    def __init__(self, since: Optional[str] = None, until: Optional[str] = None,
+                 tag_pattern: Optional[str] = None) -> None:
+        self.since = since
+        self.until = until
+        self.tag_pattern = tag_pattern
+        # shell-style pattern, e.g. 'cdda-experimental-2024-*'.
+        self._tag_match = re.compile(fnmatch.translate(tag_pattern)).match if tag_pattern else None
+
+    def __bool__(self) -> bool:
+        return bool(self.since or self.until or self.tag_pattern)
+
+    def is_older(self, release_content: Dict) -> bool:
+        # releases come newest first: once a release is older than `since`, all the following ones are too.
+        published_at = release_content.get("published_at")
+        return bool(self.since and published_at and published_at < self.since)
+
+    def matches(self, release_content: Dict) -> bool:
+        published_at = release_content.get("published_at")
+        if self.since and (not published_at or published_at < self.since):
+            return False
+        if self.until and (not published_at or published_at > self.until):
+            return False
+        if self._tag_match is not None and not self._tag_match(release_content["tag_name"]):
+            return False
+        return True
+
 
 class PageLoader:
-    def __init__(self, owner: str, repository: str) -> None:
-        self.url = URL_TEMPLATE.format(owner=owner, repository=repository)
+    def __init__(self, owner: str, repository: str, workers: int = 1,
+                 session: Optional[requests.Session] = None, cache: Optional[ResponseCache] = None,
+                 columnar: bool = False, scheduler: Optional[RequestScheduler] = None,
+                 release_callback: Optional[Callable[[Release], None]] = None, keep_releases: bool = True,
+                 archive: Optional[PageArchive] = None, release_filter: Optional[ReleaseFilter] = None,
+                 url_template: Optional[str] = None, max_releases: Optional[int] = None) -> None:
+        # `url_template` points the loader at another API server (e.g. GitHub Enterprise, or a local stub in tests).
+        url_template = url_template if url_template is not None else URL_TEMPLATE
+        self.url = url_template.format(owner=owner, repository=repository)
+        self.workers = max(1, workers)
+        self._session = session if session is not None else create_session(self.workers)
+        self._scheduler = scheduler if scheduler is not None else RequestScheduler(self.workers)
+        self._cache = cache
+        # pages are either recorded to, or replayed from, the archive.
+        self._archive = archive
+        self.release_filter = release_filter
+        self._is_past_since = False  # a release older than the filter 'since' date has been seen.
+        # only the `max_releases` most recent (filtered) releases are loaded; no page is fetched past them.
+        self.max_releases = max_releases
+        self._num_releases = 0
         self._num_pages: int = 1
         self.releases: List[Release] = list()
+        # in columnar mode releases are loaded in `columns` and `releases` stays empty.
+        self.columns: Optional[ReleaseColumns] = ReleaseColumns() if columnar else None
+        # called with each release as soon as it's parsed; with `keep_releases` unset releases are only handed to
+        # the callback (streaming exports).
+        self.release_callback = release_callback
+        self.keep_releases = keep_releases
 
     @staticmethod
     def _parse_links(headers: dict) -> Optional[List[int]]:
@@ -131,7 +1563,8 @@ class PageLoader:
             return None
 
         matches: List[int] = list()
-        for m in re.finditer(r"page=(\d+)", link):
+        # note: don't match the 'per_page' query parameter.
+        for m in re.finditer(r"[?&]page=(\d+)", link):
             page_num = int(m.group(1))
             matches.append(page_num)
 
@@ -140,81 +1573,583 @@ class PageLoader:
 
     @staticmethod
     def convert_date_time(date_time: str) -> datetime.datetime:
-        return datetime.datetime.strptime(date_time, "%Y-%m-%dT%H:%M:%S%z")
+        # fromisoformat() is a C fast path, unlike strptime(); before python 3.11 it doesn't know about 'Z'.
+        if date_time.endswith("Z"):
+            date_time = date_time[:-1] + "+00:00"
+        return datetime.datetime.fromisoformat(date_time)
+
+    def _get_page_content(self, url: str, **kwargs) -> str:
+        if self._archive is not None and self._archive.is_replay:
+            text, response_headers = self._archive.get(url)
+        else:
+            text, response_headers = self._request_page(url)
+            if self._archive is not None:
+                self._archive.add(url, response_headers, text)
 
-    @staticmethod
-    def _get_page_content(url: str, **kwargs) -> str:
-        start = timer()
-        response = requests.get(url, headers=HEADERS)
-        end = timer()
-        request_time = end - start
-        if response.status_code != 200:
-            msg = f"Error requesting url: {response.status_code} - url: {url}"
-            logger.error(msg)
-            raise RuntimeError(msg)
-        logger.debug(f"Request time: {request_time} seconds.")
         headers = kwargs.get("headers")
         if headers is not None:
             if isinstance(headers, list):
-                headers.append(response.headers)
+                headers.append(response_headers)
             else:
                 logger.error(f"headers must be a list. Got: '{type(headers)}'.")
-        return response.text
+        return text
+
+    def _request_page(self, url: str) -> Tuple[str, requests.structures.CaseInsensitiveDict]:
+        cache_entry = self._cache.get(url) if self._cache is not None else None
+        start = timer()
+        response = self._session.get(url, headers=ResponseCache.conditional_headers(cache_entry),
+                                     timeout=REQUEST_TIMEOUT)
+        end = timer()
+        request_time = end - start
+        self._scheduler.update_budget(response.headers)
+        metrics.observe("request_latency_seconds", request_time)
+        metrics.inc("requests_total", status=response.status_code)
+        # the content length is the size on the wire (compressed), `content` is the decoded body.
+        content_length = response.headers.get("content-length")
+        metrics.inc("response_bytes_total", int(content_length) if content_length else len(response.content))
+        if response.status_code == 304 and cache_entry is not None:
+            logger.debug(f"Not modified, using cached content for: {url}")
+            metrics.inc("cache_hits_total")
+            response_headers = requests.structures.CaseInsensitiveDict(cache_entry["headers"])
+            text = cache_entry["body"]
+        elif response.status_code != 200:
+            msg = f"Error requesting url: {response.status_code} - url: {url}"
+            logger.debug(msg)
+            raise PageFetchError(msg, response.status_code, response.headers)
+        else:
+            response_headers = response.headers
+            text = response.text
+            if self._cache is not None:
+                self._cache.store(url, response_headers, text)
+        logger.debug(f"Request time: {request_time} seconds.")
+        return text, response_headers
+
+    def get_first_page_content(self) -> str:
+        return self._scheduler.call(self._get_page_content, self._page_url(1))
 
     def _get_first_page(self):
         headers = list()
-        page_content = self._get_page_content(self.url, headers=headers)
+        page_content = self._scheduler.call(functools.partial(self._get_page_content, headers=headers),
+                                            self._page_url(1))
         links = self._parse_links(headers[0])
-        if len(links) == 2:
+        if links and len(links) == 2:
             self._num_pages = links[1]
         logger.info(f"Detected {self._num_pages} release pages.")
         return page_content
 
-    def _parse_release(self, content: List[dict], page_num: int):
-        for i, release_content in enumerate(content):
+    def _parse_release(self, content: Iterable[Dict], page_num: int):
+        # decoding (`content` is usually `iter_releases()`) and object construction are interleaved; both are timed
+        # separately.
+        parse_time = 0.0
+        build_time = 0.0
+        content = iter(content)
+        i = 0
+        while True:
+            start = timer()
+            release_content = next(content, None)
+            parse_time += timer() - start
+            if release_content is None:
+                break
             logger.debug(f"Parsing release #{i} on page {page_num}")
+            start = timer()
+            self._add_release(release_content)
+            build_time += timer() - start
+            i += 1
+        metrics.add_stage_time("parse", parse_time)
+        metrics.add_stage_time("build", build_time)
+        metrics.inc("releases_total", i)
+
+    def _add_release(self, release_content: Dict):
+        if self.release_filter:
+            if self.release_filter.is_older(release_content):
+                self._is_past_since = True
+            if not self.release_filter.matches(release_content):
+                return
+        if self._is_full:
+            return
+        self._num_releases += 1
+        release: Optional[Release] = None
+        if not self.keep_releases:
+            pass
+        elif self.columns is not None:
+            self.columns.append(release_content)
+        else:
             release = Release(release_content)
             self.releases.append(release)
+        if self.release_callback is not None:
+            self.release_callback(release if release is not None else Release(release_content))
+
+    @property
+    def _is_full(self) -> bool:
+        return self.max_releases is not None and self._num_releases >= self.max_releases
+
+    def iter_asset_rows(self) -> Iterator[Tuple]:
+        if self.columns is not None:
+            return self.columns.iter_asset_rows()
+        return iter_asset_rows(self.releases)
+
+    def total_downloads(self) -> int:
+        if self.columns is not None:
+            return self.columns.total_downloads()
+        return sum(release.total_downloads for release in self.releases)
+
+    def sum_os(self) -> Dict[str, int]:
+        if self.columns is not None:
+            return self.columns.sum_os()
+        total_per_os: Dict[str, int] = dict()
+        for release in self.releases:
+            for k, v in release.sum_os().items():
+                total_per_os[k] = total_per_os.get(k, 0) + v
+        return total_per_os
+
+    def _page_url(self, page_num: int) -> str:
+        if page_num == 1:
+            return self.url + f"?per_page={PER_PAGE}"
+        return self.url + f"?per_page={PER_PAGE}&page={page_num}"
 
     def parse_releases(self):
         content = self._get_first_page()
-        for i in range(1, self._num_pages + 1):
-            if i > 1:
-                url = self.url + f"?page={i}"
-                content = self._get_page_content(url)
-            json_content = json.loads(content)
-            self._parse_release(json_content, i)
+        self._parse_release(iter_releases(content), 1)
 
+        # all the remaining pages are handed to the scheduler at once; `map()` yields them back in page order, so
+        # releases are appended in the same order as a sequential fetch.
+        # With a 'since' filter or a maximum number of releases, pages are requested `workers` at a time instead, and
+        # fetching stops as soon as a release older than 'since' is seen, or enough releases are loaded.
+        urls = [self._page_url(i) for i in range(2, self._num_pages + 1)]
+        if urls:
+            logger.info(f"Fetching {len(urls)} remaining pages with {self.workers} workers.")
+        is_bounded = (self.release_filter is not None and self.release_filter.since) or self.max_releases is not None
+        batch_size = self.workers if is_bounded else max(1, len(urls))
+        for batch_start in range(0, len(urls), batch_size):
+            if self._is_past_since:
+                logger.info(f"Reached releases older than {self.release_filter.since}; "
+                            f"skipping {len(urls) - batch_start} pages.")
+                break
+            if self._is_full:
+                logger.info(f"Loaded {self.max_releases} releases; skipping {len(urls) - batch_start} pages.")
+                break
+            batch = urls[batch_start:batch_start + batch_size]
+            for i, (_, page_content) in enumerate(self._scheduler.map(self._get_page_content, batch),
+                                                  start=batch_start + 2):
+                self._parse_release(iter_releases(page_content), i)
 
-def main(args):
-    page_loader = PageLoader(OWNER, REPO)
-    page_loader.parse_releases()
+    @staticmethod
+    def _sync_page(store: ReleaseStore, content: str, cutoff: datetime.datetime) -> bool:
+        # stores the page releases; returns whether the walk can stop at this page.
+        found_known = False
+        oldest_date: Optional[str] = None
+        for release_content in iter_releases(content):
+            if release_content["id"] in store:
+                found_known = True
+            store.update(release_content)
+            oldest_date = release_content.get("published_at") or oldest_date
+        is_past_window = oldest_date is None or PageLoader.convert_date_time(oldest_date) < cutoff
+        return found_known and is_past_window
+
+    def sync_releases(self, store: ReleaseStore, refresh_days: int = 30):
+        # Incremental sync: pages are walked newest first and the walk stops on the first page holding an already
+        # known release, as long as that page also reaches past the refresh window. Download counts of releases
+        # published inside the window are refreshed; older releases are taken from the store as they are.
+        # Pages are requested `workers` at a time (the whole history, on the first sync into an empty store); at most
+        # `workers - 1` pages past the stopping page are fetched for nothing.
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=refresh_days)
+        page_num = 1
+        is_done = self._sync_page(store, self._get_first_page(), cutoff)
+        while not is_done and page_num < self._num_pages:
+            batch = [self._page_url(i) for i in range(page_num + 1, min(page_num + self.workers, self._num_pages) + 1)]
+            for _, content in self._scheduler.map(self._get_page_content, batch):
+                page_num += 1
+                is_done = self._sync_page(store, content, cutoff)
+                if is_done:
+                    break
+
+        logger.info(f"Synced {page_num} of {self._num_pages} pages; {len(store)} releases in store.")
+        store.save()
+        for release_content in store.records():
+            self._add_release(release_content)
+
+
+def parse_timestamp(text: str) -> str:
+    # command line dates (either a date or a date and time, UTC if naive) to the snapshot timestamp format.
+    date_time = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if date_time.tzinfo is None:
+        date_time = date_time.replace(tzinfo=datetime.timezone.utc)
+    return date_time.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def print_deltas(args) -> int:
+    if not args.snapshot_db or not args.snapshot_db.is_file():
+        logger.error(f"The snapshot database '{args.snapshot_db}' is not a file or does not exist.")
+        return -1
+
+    with SnapshotStore(args.snapshot_db) as snapshot_store:
+        snapshots = snapshot_store.find_snapshots(args.since, args.until)
+        if snapshots is None:
+            logger.error("Need at least two snapshots in the given time range.")
+            return -1
+        (start_id, start_time), (end_id, end_time) = snapshots
+        days = (PageLoader.convert_date_time(end_time) - PageLoader.convert_date_time(start_time)).total_seconds()
+        days /= 86400
+
+        print(f"From {start_time} to {end_time} ({days:.2f} days)")
+        per_os = snapshot_store.deltas(start_id, end_id, "os")
+        total = sum(delta for (_, delta) in per_os)
+        print(f"Total: {total} [{total / days:.2f}/day]")
+        print("Per OS:")
+        for os_name, delta in per_os:
+            print(f"    - {os_name}: {delta} [{delta / days:.2f}/day]")
 
+        per_release = snapshot_store.deltas(start_id, end_id, "release")
+        print(f"Top {args.top} releases:")
+        for release_name, delta in per_release[:args.top]:
+            print(f"    - {release_name}: {delta} [{delta / days:.2f}/day]")
+
+    return 0
+
+
+def print_report(releases: List[Release]) -> None:
+    out = ChunkedWriter(sys.stdout)
     downloads = list()
-    for release in page_loader.releases:
+    for release in releases:
         download = release.total_downloads
         downloads.append(download)
-        print(f"{release.name}: {download} [{release.published_at}]")
+        out.write(f"{release.name}: {download} [{release.published_at}]\n")
         for asset in release.assets:
-            print(f"    - {asset.display_name}: {asset.download_count}")
+            out.write(f"    - {asset.display_name}: {asset.download_count}\n")
 
     # ---- totals
     total_downloads = sum(downloads)
-    print(f"{'-' * 79}\nTotal: {total_downloads}")
+    out.write(f"{'-' * 79}\nTotal: {total_downloads}\n")
     total_per_os = dict()
-    for release in page_loader.releases:
+    for release in releases:
         for k, v in release.sum_os().items():
             if k not in total_per_os.keys():
                 total_per_os[k] = 0
             total_per_os[k] += v
 
-    print('Total per OS:')
+    out.write('Total per OS:\n')
     for k, v in total_per_os.items():
-        print(f"    - {k}: {v} [{(v / total_downloads) * 100:.2f}%]")
+        out.write(f"    - {k}: {v} [{(v / total_downloads) * 100:.2f}%]\n")
+    out.flush()
+
+
+def print_columns_report(columns: ReleaseColumns) -> None:
+    # same output as `print_report()`, straight from the columns.
+    out = ChunkedWriter(sys.stdout)
+    for i in range(len(columns)):
+        out.write(f"{columns.names[i]}: {columns.total_downloads(i)} [{columns.published_at[i]}]\n")
+        for j in columns.asset_range(i):
+            out.write(f"    - {columns.asset_display_names[j]}: {columns.download_counts[j]}\n")
+
+    # ---- totals
+    total_downloads = columns.total_downloads()
+    out.write(f"{'-' * 79}\nTotal: {total_downloads}\n")
+    out.write('Total per OS:\n')
+    for k, v in columns.sum_os().items():
+        out.write(f"    - {k}: {v} [{(v / total_downloads) * 100:.2f}%]\n")
+    out.flush()
+
+
+def print_aggregation(page_loader: "PageLoader", args) -> None:
+    if page_loader.columns is not None:
+        aggregator = DownloadAggregator.from_columns(page_loader.columns)
+    else:
+        aggregator = DownloadAggregator.from_releases(page_loader.releases)
+
+    keys = args.group_by.split(",") if args.group_by else DownloadAggregator.PRESETS[args.preset]
+    total = aggregator.total
+    groups = aggregator.top(keys, args.top) if args.top else aggregator.group_by(keys)
+    print(f"Total: {total}")
+    print(f"Downloads per {' x '.join(keys)}:")
+    for labels, downloads in groups:
+        share = (downloads / total) * 100 if total else 0.0
+        print(f"    - {' / '.join(labels)}: {downloads} [{share:.2f}%]")
+    if args.percentiles:
+        print(f"Percentiles of downloads per {' x '.join(keys)}:")
+        for percentile, value in aggregator.percentiles(keys, args.percentiles).items():
+            print(f"    - p{percentile:g}: {value:.0f}")
 
+
+def run_query(index: ReleaseIndex, query: str, out: IO) -> None:
+    # query language, one query per line:
+    #   tag <tag name>                         release and its assets.
+    #   range <since> [<until>]                releases published in the range.
+    #   top-releases <n> [<since> [<until>]]   most downloaded releases.
+    #   top-assets <n> [<os>]                  most downloaded assets, optionally for a single OS (or 'Unclassified').
+    words = query.split()
+    if not words:
+        return
+    command, params = words[0], words[1:]
+    if command == "tag" and len(params) == 1:
+        i = index.find_tag(params[0])
+        if i is None:
+            out.write(f"No release with tag '{params[0]}'.\n")
+            return
+        out.write(f"{index.release_label(i)}: {index.release_totals[i]} [{index.published_at[i]}]\n")
+        for j in range(index.asset_start[i], index.asset_start[i + 1]):
+            out.write(f"    - {index.asset_names[j]}: {index.download_counts[j]}\n")
+    elif command == "range" and 1 <= len(params) <= 2:
+        dates = [parse_timestamp(param) for param in params]
+        for i in index.date_range(*dates):
+            out.write(f"{index.release_label(i)}: {index.release_totals[i]} [{index.published_at[i]}]\n")
+    elif command == "top-releases" and 1 <= len(params) <= 3:
+        dates = [parse_timestamp(param) for param in params[1:]]
+        for i in index.top_releases(int(params[0]), *dates):
+            out.write(f"{index.release_label(i)}: {index.release_totals[i]} [{index.published_at[i]}]\n")
+    elif command == "top-assets" and 1 <= len(params) <= 2:
+        os_name = params[1] if len(params) > 1 else None
+        if os_name is not None and os_name not in EXPORT_OS_COLUMNS:
+            raise ValueError(f"Unknown OS '{os_name}', expected one of: {', '.join(EXPORT_OS_COLUMNS)}")
+        for i, j in index.top_assets(int(params[0]), os_name=os_name):
+            out.write(f"{index.asset_names[j]}: {index.download_counts[j]} [{index.release_label(i)}]\n")
+    else:
+        raise ValueError(f"Invalid query: '{query.strip()}'")
+
+
+def query_releases(page_loader: PageLoader, queries: List[str]) -> int:
+    if page_loader.columns is not None:
+        index = ReleaseIndex.from_columns(page_loader.columns)
+    else:
+        index = ReleaseIndex.from_releases(page_loader.releases)
+    logger.info(f"Indexed {len(index)} releases.")
+
+    # queries from the command line, else one query per line from stdin (interactive session).
+    is_interactive = not queries and sys.stdin.isatty()
+    lines = queries if queries else sys.stdin
+    if is_interactive:
+        print("> ", end="", flush=True)
+    for line in lines:
+        start = timer()
+        try:
+            run_query(index, line, sys.stdout)
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            logger.error(e)
+        logger.debug(f"Query '{line.strip()}' took {(timer() - start) * 1000:.3f} ms.")
+        if is_interactive:
+            print("> ", end="", flush=True)
     return 0
 
 
+def parse_repository(text: str) -> Tuple[str, str]:
+    owner, sep, repository = text.partition("/")
+    if not sep or not owner or not repository or "/" in repository:
+        raise argparse.ArgumentTypeError(f"Expected 'owner/repository', got: '{text}'")
+    return owner, repository
+
+
+def load_repositories(repositories: List[Tuple[str, str]], workers: int, cache: Optional[ResponseCache],
+                      scheduler: RequestScheduler, columnar: bool = False,
+                      archive: Optional[PageArchive] = None,
+                      release_filter: Optional[ReleaseFilter] = None) -> Dict[str, PageLoader]:
+    # Batch mode: all the repositories are loaded at the same time, each one from its own (lightweight)
+    # coordinating thread. The requests themselves all go through the shared scheduler (one bounded pool and one
+    # rate limit budget) and the shared session (one connection pool).
+    session = create_session(workers)
+    page_loaders = {
+        f"{owner}/{repository}": PageLoader(owner, repository, workers=workers, session=session, cache=cache,
+                                            columnar=columnar, scheduler=scheduler, archive=archive,
+                                            release_filter=release_filter)
+        for (owner, repository) in repositories
+    }
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(page_loaders)) as coordinators:
+        futures = {name: coordinators.submit(page_loader.parse_releases)
+                   for (name, page_loader) in page_loaders.items()}
+        for name, future in futures.items():
+            future.result()
+            logger.info(f"Loaded {name}.")
+    return page_loaders
+
+
+def print_batch_report(page_loaders: Dict[str, PageLoader]) -> None:
+    out = ChunkedWriter(sys.stdout)
+    combined_total = 0
+    combined_per_os: Dict[str, int] = dict()
+    for name, page_loader in page_loaders.items():
+        total_downloads = page_loader.total_downloads()
+        num_releases = len(page_loader.columns) if page_loader.columns is not None else len(page_loader.releases)
+        out.write(f"{name}: {total_downloads} [{num_releases} releases]\n")
+        for k, v in page_loader.sum_os().items():
+            share = (v / total_downloads) * 100 if total_downloads else 0.0
+            out.write(f"    - {k}: {v} [{share:.2f}%]\n")
+            combined_per_os[k] = combined_per_os.get(k, 0) + v
+        combined_total += total_downloads
+
+    out.write(f"{'-' * 79}\nTotal ({len(page_loaders)} repositories): {combined_total}\n")
+    out.write('Total per OS:\n')
+    for k, v in combined_per_os.items():
+        share = (v / combined_total) * 100 if combined_total else 0.0
+        out.write(f"    - {k}: {v} [{share:.2f}%]\n")
+    out.flush()
+
+
+def make_release_filter(args) -> Optional[ReleaseFilter]:
+    release_filter = ReleaseFilter(args.filter_since, args.filter_until, args.tag_pattern)
+    return release_filter if release_filter else None
+
+
+def open_archive(args) -> Optional[PageArchive]:
+    if args.replay:
+        return PageArchive(args.replay, "r")
+    if args.record:
+        return PageArchive(args.record, "w")
+    return None
+
+
+def export_releases(args, archive: Optional[PageArchive]) -> int:
+    owner, repository = args.repositories[0]
+    cache = ResponseCache(args.cache_dir) if args.cache_dir else None
+    with RequestScheduler(args.workers, max_retries=args.retries) as scheduler, \
+            Exporter.create(args.format, args.output, args.level) as exporter:
+        # records are written as the pages are parsed; the releases themselves aren't kept.
+        page_loader = PageLoader(owner, repository, workers=args.workers, cache=cache, scheduler=scheduler,
+                                 release_callback=exporter.write_release, keep_releases=False, archive=archive,
+                                 release_filter=make_release_filter(args))
+        page_loader.parse_releases()
+    return 0
+
+
+def mirror_releases(args, archive: Optional[PageArchive]) -> int:
+    owner, repository = args.repositories[0]
+    cache = ResponseCache(args.cache_dir) if args.cache_dir else None
+    with RequestScheduler(args.workers, max_retries=args.retries) as scheduler:
+        # releases are newest first: only the pages holding the `latest` releases are fetched.
+        page_loader = PageLoader(owner, repository, workers=args.workers, cache=cache, scheduler=scheduler,
+                                 archive=archive, release_filter=make_release_filter(args),
+                                 max_releases=args.latest or None)
+        page_loader.parse_releases()
+
+    releases = page_loader.releases
+    items = list()
+    for release in releases:
+        for asset in release.assets:
+            if not asset_matches(asset, args.os, args.ui, args.arch):
+                continue
+            if not asset.url:
+                logger.warning(f"No download url for '{asset.name}' in release {release.tag_name}.")
+                continue
+            items.append(MirrorItem(release, asset))
+    logger.info(f"Mirroring {len(items)} assets from {len(releases)} releases to: {args.output}")
+
+    asset_mirror = AssetMirror(args.output, create_session(args.download_workers))
+    with RequestScheduler(args.download_workers, max_retries=args.retries) as download_scheduler:
+        with metrics.time_stage("download"):
+            results = asset_mirror.mirror(items, download_scheduler)
+    logger.info("Mirror: " + ", ".join(f"{count} {result}" for (result, count) in sorted(results.items())))
+    return -1 if results.get("failed") else 0
+
+
+def poll_releases(args) -> int:
+    owner, repository = args.repositories[0]
+    # conditional requests for the polled page; in memory unless an on-disk cache is given.
+    cache = ResponseCache(args.cache_dir)
+    output = args.output.open("a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        with RequestScheduler(args.workers, max_retries=args.retries) as scheduler:
+            page_loader = PageLoader(owner, repository, workers=args.workers, cache=cache, scheduler=scheduler,
+                                     keep_releases=False)
+            poller = ReleasePoller(page_loader, output, args.interval)
+            # initial (full) load: the poller only keeps the download counts.
+            page_loader.release_callback = poller.track_release
+            if args.store:
+                page_loader.sync_releases(ReleaseStore(args.store), args.refresh_days)
+            else:
+                page_loader.parse_releases()
+            logger.info(f"Polling {owner}/{repository} every {args.interval} seconds; "
+                        f"tracking {poller.num_releases} releases.")
+            poller.run(args.count)
+    except KeyboardInterrupt:
+        logger.info("Poller stopped.")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+def run_command(args, archive: Optional[PageArchive]) -> int:
+    # every command loading releases classifies their assets.
+    if args.classifier_cache:
+        asset_classifier.load(args.classifier_cache)
+
+    if args.command_name in ("export", "poll", "mirror"):
+        if args.command_name == "export":
+            result = export_releases(args, archive)
+        elif args.command_name == "poll":
+            result = poll_releases(args)
+        else:
+            result = mirror_releases(args, archive)
+        if args.classifier_cache:
+            asset_classifier.save(args.classifier_cache)
+        return result
+
+    is_batch = len(args.repositories) > 1
+
+    cache = ResponseCache(args.cache_dir) if args.cache_dir else None
+    if is_batch:
+        with RequestScheduler(args.workers, max_retries=args.retries) as scheduler:
+            page_loaders = load_repositories(args.repositories, args.workers, cache, scheduler, args.columnar,
+                                             archive, make_release_filter(args))
+        if args.classifier_cache:
+            asset_classifier.save(args.classifier_cache)
+        with metrics.time_stage("aggregate"):
+            print_batch_report(page_loaders)
+        if args.snapshot_db:
+            with SnapshotStore(args.snapshot_db) as snapshot_store:
+                snapshot_store.record(itertools.chain.from_iterable(
+                    page_loader.iter_asset_rows() for page_loader in page_loaders.values()))
+        return 0
+
+    owner, repository = args.repositories[0]
+    with RequestScheduler(args.workers, max_retries=args.retries) as scheduler:
+        page_loader = PageLoader(owner, repository, workers=args.workers, cache=cache, columnar=args.columnar,
+                                 scheduler=scheduler, archive=archive, release_filter=make_release_filter(args))
+        if args.store:
+            page_loader.sync_releases(ReleaseStore(args.store), args.refresh_days)
+        else:
+            page_loader.parse_releases()
+
+    if args.classifier_cache:
+        asset_classifier.save(args.classifier_cache)
+
+    if args.command_name == "query":
+        return query_releases(page_loader, args.queries)
+
+    with metrics.time_stage("aggregate"):
+        if args.command_name == "aggregate":
+            print_aggregation(page_loader, args)
+        elif page_loader.columns is not None:
+            print_columns_report(page_loader.columns)
+        else:
+            print_report(page_loader.releases)
+
+    if args.snapshot_db:
+        with SnapshotStore(args.snapshot_db) as snapshot_store:
+            snapshot_store.record(page_loader.iter_asset_rows())
+
+    return 0
+
+
+def main(args):
+    if args.command_name == "deltas":
+        return print_deltas(args)
+
+    if not args.repositories:
+        args.repositories = [(OWNER, REPO)]
+    is_batch = len(args.repositories) > 1
+    if is_batch and (args.command_name not in (None, "report") or args.store):
+        logger.error("Multiple repositories are only supported by the report, without the incremental sync.")
+        return -1
+
+    archive = open_archive(args)
+    try:
+        with metrics.time_stage("total"):
+            return run_command(args, archive)
+    finally:
+        if archive is not None:
+            archive.close()
+        if args.metrics_output:
+            metrics.write(args.metrics_output)
+
+
 if __name__ == "__main__":
     arg_parser = argparse.ArgumentParser(description="TODO")
 
@@ -222,6 +2157,106 @@ if __name__ == "__main__":
                             choices=['NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], default='INFO',
                             help="Set the logging level")
 
+    arg_parser.add_argument("-r", "--repo", type=parse_repository, action="append", dest="repositories", default=[],
+                            help=f"'owner/repository' to load; repeat for a batch run sharing one request pool. "
+                                 f"Default: {OWNER}/{REPO}.")
+
+    arg_parser.add_argument("-w", "--workers", type=int, action="store", default=1,
+                            help="Number of release pages fetched concurrently (default: 1, sequential).")
+
+    arg_parser.add_argument("--retries", type=int, action="store", default=5,
+                            help="Maximum number of retries of a page request on transient errors.")
+
+    arg_parser.add_argument("-c", "--cache-dir", type=pathlib.Path, action="store", default=None,
+                            help="Directory of the on-disk response cache (conditional requests). Disabled if unset.")
+
+    arg_parser.add_argument("-s", "--store", type=pathlib.Path, action="store", default=None,
+                            help="Path to a local release store (json); enables the incremental sync.")
+
+    arg_parser.add_argument("--refresh-days", type=int, action="store", default=30,
+                            help="Incremental sync: refresh download counts of releases published in the last N days.")
+
+    archive_group = arg_parser.add_mutually_exclusive_group()
+    archive_group.add_argument("--record", type=pathlib.Path, action="store", default=None,
+                               help="Record every fetched page and its headers to a compressed archive (zip).")
+    archive_group.add_argument("--replay", type=pathlib.Path, action="store", default=None,
+                               help="Replay pages from an archive made with --record instead of the network.")
+
+    arg_parser.add_argument("-m", "--metrics-output", type=pathlib.Path, action="store", default=None,
+                            help="Write the run metrics at exit: Prometheus text format for '.prom' files, else json.")
+
+    arg_parser.add_argument("--since", type=parse_timestamp, dest="filter_since", metavar="DATE", default=None,
+                            help="Only releases published at or after this ISO date; stops fetching older pages.")
+
+    arg_parser.add_argument("--until", type=parse_timestamp, dest="filter_until", metavar="DATE", default=None,
+                            help="Only releases published at or before this ISO date.")
+
+    arg_parser.add_argument("--tag-pattern", type=str, default=None,
+                            help="Only releases whose tag matches this shell-style pattern (e.g. 'cdda-0.G*').")
+
+    arg_parser.add_argument("--columnar", action="store_true",
+                            help="Load releases in a compact columnar store (less memory for the full history).")
+
+    arg_parser.add_argument("--classifier-cache", type=pathlib.Path, action="store", default=None,
+                            help="Path to a json file caching the asset name classification across runs.")
+
+    arg_parser.add_argument("-d", "--snapshot-db", type=pathlib.Path, action="store", default=None,
+                            help="Path to the download snapshots database (sqlite); each report records a snapshot.")
+
+    #
+    # sub-commands; the release report is the default.
+    #
+    subparsers = arg_parser.add_subparsers(help='help for sub-commands', dest="command_name")
+
+    subparsers.add_parser('report', help='Print the per-release and per-OS download totals (default).')
+
+    parser_deltas = subparsers.add_parser('deltas', help='Print download deltas between two snapshots.')
+    parser_deltas.add_argument("--since", type=parse_timestamp, default=None,
+                               help="Use the first snapshot taken at or after this ISO date (default: oldest).")
+    parser_deltas.add_argument("--until", type=parse_timestamp, default=None,
+                               help="Use the last snapshot taken at or before this ISO date (default: newest).")
+    parser_deltas.add_argument("--top", type=int, default=20, help="Number of releases to display.")
+
+    parser_export = subparsers.add_parser('export', help='Stream release or asset records to a file.')
+    parser_export.add_argument("-f", "--format", choices=["jsonl", "csv", "parquet"], default="jsonl",
+                               help="Output format (parquet requires pyarrow).")
+    parser_export.add_argument("--level", choices=Exporter.LEVELS, default="release",
+                               help="One record per release or per asset.")
+    parser_export.add_argument("-o", "--output", type=pathlib.Path, required=True, help="Output file path.")
+
+    parser_poll = subparsers.add_parser('poll', help='Keep polling the releases and emit the changes (json lines).')
+    parser_poll.add_argument("-i", "--interval", type=float, default=300.0, help="Seconds between two polls.")
+    parser_poll.add_argument("-o", "--output", type=pathlib.Path, default=None,
+                             help="File the changes are appended to (default: stdout).")
+    parser_poll.add_argument("--count", type=int, default=None, help="Stop after N polls (default: never).")
+
+    parser_aggregate = subparsers.add_parser('aggregate', help='Print download breakdowns (requires numpy).')
+    parser_aggregate.add_argument("--preset", choices=sorted(DownloadAggregator.PRESETS.keys()), default="os",
+                                  help="Named group-by preset (default: 'os', the per-OS totals).")
+    parser_aggregate.add_argument("--group-by", type=str, default=None,
+                                  help=f"Comma separated group-by keys, overrides the preset. "
+                                       f"Keys: {', '.join(DownloadAggregator.DIMENSIONS)}.")
+    parser_aggregate.add_argument("--top", type=int, default=0, help="Only display the N largest groups.")
+    parser_aggregate.add_argument("--percentiles", type=float, nargs="*", default=None,
+                                  help="Percentiles of the per-group downloads (e.g. 50 90 99).")
+
+    parser_query = subparsers.add_parser('query', help='Query the loaded releases by tag, date range or downloads.')
+    parser_query.add_argument("queries", type=str, nargs="*",
+                              help="Queries: 'tag <tag>', 'range <since> [<until>]', 'top-releases <n> [<since> "
+                                   "[<until>]]', 'top-assets <n> [<os>]'. Read from stdin if none is given.")
+
+    parser_mirror = subparsers.add_parser('mirror', help='Download release assets to a local mirror (resumable).')
+    parser_mirror.add_argument("-o", "--output", type=pathlib.Path, required=True, help="Mirror directory.")
+    parser_mirror.add_argument("-n", "--latest", type=int, default=None,
+                               help="Only mirror the N most recent (filtered) releases. Default: all of them.")
+    parser_mirror.add_argument("--os", choices=list(OS_FLAGS.keys()), nargs="+", default=None,
+                               help="Only mirror assets for these OSes.")
+    parser_mirror.add_argument("--ui", choices=["tiles", "curses"], nargs="+", default=None,
+                               help="Only mirror assets with these user interfaces.")
+    parser_mirror.add_argument("--arch", choices=["32-bit", "64-bit"], nargs="+", default=None,
+                               help="Only mirror assets for these architectures.")
+    parser_mirror.add_argument("--download-workers", type=int, default=4, help="Number of concurrent downloads.")
+
     parsed_args = arg_parser.parse_args()
 
     logging_level = logging.getLevelName(parsed_args.log_level)
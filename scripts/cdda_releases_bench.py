@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for cdda_releases.py: fetch, parse and aggregation throughput on synthetic GitHub release pages.
+
+Synthetic pages are generated on disk for each scale and served by a local HTTP stand-in of the GitHub API (in its
+own process, so that serving doesn't compete with the measured code). Results are written to a json file; when a
+baseline result file is given, any metric worse than the baseline by more than the threshold is reported and the
+script exits with a non-zero code.
+
+Examples:
+    $ python cdda_releases_bench.py --scales 100 1000 10000 -o bench.json
+    $ python cdda_releases_bench.py --scales 100 1000 10000 -o new.json --baseline bench.json --threshold 0.2
+"""
+import argparse
+import concurrent.futures
+import datetime
+import http.server
+import json
+import logging
+import multiprocessing
+import pathlib
+import random
+import sys
+import tempfile
+import time
+import urllib.parse
+from typing import Dict, List, Optional
+
+import cdda_releases
+
+try:
+    import resource
+except ImportError:  # not available on Windows.
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+OWNER = "bench"
+REPO = "releases"
+RESULTS_VERSION = 1
+ASSET_TEMPLATES = [
+    "cdda-windows-tiles-x64-{tag}.zip",
+    "cdda-windows-curses-x64-{tag}.zip",
+    "cdda-windows-tiles-{tag}.zip",
+    "cdda-linux-tiles-x64-{tag}.tar.gz",
+    "cdda-linux-curses-x64-{tag}.tar.gz",
+    "cdda-osx-tiles-x64-{tag}.dmg",
+    "cdda-android-x64-{tag}.apk",
+]
+# metric name -> True if higher is better.
+METRICS = {
+    "fetch_seconds": False,
+    "requests_per_second": True,
+    "parse_seconds": False,
+    "parse_mb_per_second": True,
+    "build_seconds": False,
+    "aggregate_seconds": False,
+    "peak_rss_mb": False,
+}
+
+
+def generate_page(first_release: int, num_releases: int, num_assets: int, rnd: random.Random) -> List[Dict]:
+    # releases look like the API ones, including the fields the tool drops (body, author, uploader...).
+    start_date = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    releases = list()
+    for i in range(first_release, first_release + num_releases):
+        tag = f"cdda-experimental-{i:06d}"
+        assets = list()
+        for j in range(num_assets):
+            name = ASSET_TEMPLATES[j % len(ASSET_TEMPLATES)].format(tag=f"{tag}-{j}")
+            assets.append({
+                "id": i * 1000 + j,
+                "name": name,
+                "label": "",
+                "download_count": rnd.randint(0, 5000),
+                "size": rnd.randint(10 ** 6, 10 ** 8),
+                "content_type": "application/octet-stream",
+                "browser_download_url": f"https://example.invalid/{tag}/{name}",
+                "uploader": {"login": "github-actions[bot]", "id": 41898282, "type": "Bot"},
+            })
+        published_at = start_date - datetime.timedelta(hours=i)
+        releases.append({
+            "id": 10 ** 7 - i,
+            "tag_name": tag,
+            "name": tag.replace("-", " ").title(),
+            "published_at": published_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "prerelease": i % 10 != 0,
+            "author": {"login": "github-actions[bot]", "id": 41898282, "type": "Bot"},
+            "body": "Changelog\n" + "- change\n" * 50,
+            "assets": assets,
+        })
+    return releases
+
+
+def generate_pages(page_dir: pathlib.Path, num_releases: int, num_assets: int) -> int:
+    rnd = random.Random(num_releases)
+    num_pages = max(1, -(-num_releases // cdda_releases.PER_PAGE))
+    for page_num in range(1, num_pages + 1):
+        first_release = (page_num - 1) * cdda_releases.PER_PAGE
+        page_size = min(cdda_releases.PER_PAGE, num_releases - first_release)
+        page = generate_page(first_release, page_size, num_assets, rnd)
+        (page_dir / f"{page_num}.json").write_text(json.dumps(page), encoding="utf-8")
+    return num_pages
+
+
+class PageRequestHandler(http.server.BaseHTTPRequestHandler):
+    # serves `<page_dir>/<page>.json` with GitHub style 'link' headers.
+    protocol_version = "HTTP/1.1"
+    page_dir: pathlib.Path = pathlib.Path()
+    num_pages = 1
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        page_num = int(query.get("page", 1))
+        page_path = self.page_dir / f"{page_num}.json"
+        if not page_path.is_file():
+            self.send_error(404)
+            return
+        body = page_path.read_bytes()
+        self.send_response(200)
+        if page_num < self.num_pages:
+            base = f"http://{self.headers['Host']}{url.path}?per_page={cdda_releases.PER_PAGE}"
+            self.send_header("Link", f'<{base}&page={page_num + 1}>; rel="next", '
+                                     f'<{base}&page={self.num_pages}>; rel="last"')
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_pages(page_dir: pathlib.Path, num_pages: int, port_queue: multiprocessing.Queue) -> None:
+    handler = type("Handler", (PageRequestHandler,), {"page_dir": page_dir, "num_pages": num_pages})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss is in KiB on Linux, in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_in_new_process(fn, *args):
+    # ru_maxrss is the high-water mark of the whole process: each step gets its own fresh ('spawn') process, so that
+    # the peak memory of a scale doesn't include the page generation or the previous scales.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                                                mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def run_scale(num_releases: int, num_assets: int, workers: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory(prefix="cdda_bench_") as tmp_dir:
+        page_dir = pathlib.Path(tmp_dir)
+        logger.info(f"Generating {num_releases} releases with {num_assets} assets each.")
+        num_pages = run_in_new_process(generate_pages, page_dir, num_releases, num_assets)
+
+        port_queue = multiprocessing.Queue()
+        server_process = multiprocessing.Process(target=serve_pages, args=(page_dir, num_pages, port_queue),
+                                                 daemon=True)
+        server_process.start()
+        try:
+            port = port_queue.get(timeout=30)
+            url_template = f"http://127.0.0.1:{port}/repos/{{owner}}/{{repository}}/releases"
+            return run_in_new_process(measure, url_template, num_pages, workers)
+        finally:
+            server_process.terminate()
+            server_process.join()
+
+
+def measure(url_template: str, num_pages: int, workers: int) -> Dict[str, float]:
+    results: Dict[str, float] = dict()
+
+    # fetch: raw page requests only.
+    with cdda_releases.RequestScheduler(workers) as scheduler:
+        page_loader = cdda_releases.PageLoader(OWNER, REPO, workers=workers, scheduler=scheduler,
+                                               url_template=url_template)
+        urls = [page_loader._page_url(i) for i in range(1, num_pages + 1)]
+        start = time.perf_counter()
+        pages = [page for (_, page) in scheduler.map(page_loader._get_page_content, urls)]
+        results["fetch_seconds"] = time.perf_counter() - start
+    results["requests_per_second"] = num_pages / results["fetch_seconds"]
+
+    # parse: decode of the pages to the slim release dicts.
+    num_bytes = sum(len(page.encode("utf-8")) for page in pages)
+    start = time.perf_counter()
+    release_contents = [r for page in pages for r in cdda_releases.iter_releases(page)]
+    results["parse_seconds"] = time.perf_counter() - start
+    results["parse_mb_per_second"] = (num_bytes / (1024 * 1024)) / results["parse_seconds"]
+    del pages
+
+    # object construction.
+    start = time.perf_counter()
+    releases = [cdda_releases.Release(release_content) for release_content in release_contents]
+    results["build_seconds"] = time.perf_counter() - start
+
+    # aggregation: the report totals.
+    start = time.perf_counter()
+    total_per_os: Dict[str, int] = dict()
+    for release in releases:
+        for k, v in release.sum_os().items():
+            total_per_os[k] = total_per_os.get(k, 0) + v
+    sum(release.total_downloads for release in releases)
+    results["aggregate_seconds"] = time.perf_counter() - start
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions: List[str] = list()
+    for scale, metrics in results["results"].items():
+        base_metrics = baseline.get("results", {}).get(scale)
+        if base_metrics is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            new, old = metrics.get(metric), base_metrics.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append(f"{scale}: {metric} {old:.4f} -> {new:.4f} ({change * 100:+.1f}%)")
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    results = {
+        "version": RESULTS_VERSION,
+        "date": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "assets": args.assets,
+        "workers": args.workers,
+        "results": dict(),
+    }
+    for num_releases in args.scales:
+        scale_results = run_scale(num_releases, args.assets, args.workers)
+        results["results"][str(num_releases)] = scale_results
+        logger.info(f"{num_releases} releases: " + ", ".join(f"{k}={v:.4f}" for (k, v) in scale_results.items()))
+
+    with args.output.open("w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results written to: {args.output}")
+
+    if args.baseline is None:
+        return 0
+    with args.baseline.open("r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("assets") != args.assets or baseline.get("workers") != args.workers:
+        logger.warning("Baseline was run with different settings; comparison may not be meaningful.")
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="cdda_releases.py benchmarks.")
+
+    arg_parser.add_argument("-l", "--log-level",
+                            choices=['NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], default='INFO',
+                            help="Set the logging level.")
+
+    arg_parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000],
+                            help="Number of releases for each benchmark run (e.g. 100 1000 10000 100000).")
+
+    arg_parser.add_argument("--assets", type=int, default=len(ASSET_TEMPLATES),
+                            help="Number of assets per release (up to 50).")
+
+    arg_parser.add_argument("-w", "--workers", type=int, default=4, help="Number of concurrent page requests.")
+
+    arg_parser.add_argument("-o", "--output", type=pathlib.Path, default="./cdda_releases_bench.json",
+                            help="Path to the json results file.")
+
+    arg_parser.add_argument("--baseline", type=pathlib.Path, default=None,
+                            help="Results file to compare with; exits with 1 on regressions.")
+
+    arg_parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Relative change considered a regression (default: 0.2, i.e. 20%%).")
+
+    parsed_args = arg_parser.parse_args()
+
+    if not 1 <= parsed_args.assets <= 50:
+        arg_parser.error("--assets must be between 1 and 50.")
+
+    logging_level = logging.getLevelName(parsed_args.log_level)
+    logging.basicConfig(level=logging_level)
+    logger.setLevel(logging_level)
+
+    sys.exit(main(parsed_args))
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import os
+import pathlib
+import threading
+
+
+def atomic_write_text(path: pathlib.Path, text: str) -> None:
+    # The text is written to a temporary file next to `path`, which is then renamed over it: a reader (or the next
+    # run, after a crash) never sees a partial file. The temporary name is unique to the process and thread, so
+    # concurrent writers of the same path don't clobber each other's temporary file.
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            tmp_path.unlink()
+        raise
@@ -1,46 +1,80 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
+import concurrent.futures
 import copy
+import functools
+import hashlib
 import json
 import logging
 import math
+import mmap
+import os
 import pathlib
 import sys
-from typing import Dict, List, Union
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+from file_utils import atomic_write_text
 
 logger = logging.getLogger(__name__)
 
 JsonDataType = List[Dict[str, Union[str, List[Dict[str, str]]]]]
 
+# input methods matching more than one kind of input; 'keyboard_any' bindings apply to both keyboard modes.
+INPUT_METHOD_ALIASES = {"keyboard_any": ("keyboard_char", "keyboard_code")}
+# input methods whose keys don't depend on the case; 'keyboard_char' keys do ('e' and 'E' are different keys).
+CASE_INSENSITIVE_INPUT_METHODS = {"keyboard_code"}
+KEYBINDING_TYPE = "keybinding"
+KEYBINDING_TYPE_MARKER = b'"keybinding"'
+# a process pool only pays off when there's a lot to decode: it starts the processes and sends every entry back.
+POOL_MIN_INPUT_SIZE = 32 * 1024 * 1024
+
 # note: see https://tex.stackexchange.com/questions/269547/rowcolor-for-a-multirow about multirows and colors.
 
 
-def escape_latex_text(text: str) -> str:
-    simple_escapes = "&%$#_{}"
-    if any([c in text for c in simple_escapes]):
-        for ch in simple_escapes:
-            if ch in text:
-                text = text.replace(ch, "\\" + ch)
+# (character, escaped character) pairs, built once. Applied with `str.replace()` for the characters present: a few C
+# level passes, which measures faster than a `str.translate()` (per character mapping lookups) or a regex pass.
+LATEX_ESCAPES = tuple((ch, "\\" + ch) for ch in "&%$#_{}")
+# texts made of a single character (i.e. keys) that need a latex command or a name instead.
+LATEX_SINGLE_CHAR_ESCAPES = {
+    "~": r"\textasciitilde",
+    "^": r"\textasciicircum",
+    "\\": r"\textbackslash",
+    " ": "<space>",
+}
+ESCAPE_SEPARATOR = "\0"  # joins a column of texts for `escape_latex_column()`; never escaped.
 
-    if len(text) == 1:
-        complex_escapes = "\\~^"
-        if any([c in text for c in complex_escapes]):
-            latex_complex_escape = {
-                "~": r"\textasciitilde",
-                "^": r"\textasciicircum",
-                "\\": r"\textbackslash"
-            }
-            for ch in complex_escapes:
-                if ch in text:
-                    text = text.replace(ch, latex_complex_escape[ch])
-
-    if text == " ":
-        text = "<space>"
 
+def replace_latex_escapes(text: str) -> str:
+    for ch, escaped in LATEX_ESCAPES:
+        if ch in text:
+            text = text.replace(ch, escaped)
     return text
 
 
+@functools.lru_cache(maxsize=4096)
+def escape_latex_text(text: str) -> str:
+    # memoized: the same key names and action names come up over and over.
+    if len(text) == 1:
+        escaped = LATEX_SINGLE_CHAR_ESCAPES.get(text)
+        if escaped is not None:
+            return escaped
+    return replace_latex_escapes(text)
+
+
+def escape_latex_column(texts: List[str]) -> List[str]:
+    # escapes a whole column at once: the replacements are done on the joined texts, then the single character
+    # special cases.
+    joined = ESCAPE_SEPARATOR.join(texts)
+    if joined.count(ESCAPE_SEPARATOR) != max(0, len(texts) - 1):
+        return [escape_latex_text(text) for text in texts]
+    escaped_texts = replace_latex_escapes(joined).split(ESCAPE_SEPARATOR) if texts else []
+    for i, text in enumerate(texts):
+        if len(text) == 1 and text in LATEX_SINGLE_CHAR_ESCAPES:
+            escaped_texts[i] = LATEX_SINGLE_CHAR_ESCAPES[text]
+    return escaped_texts
+
+
 class Binding:
     __slots__ = ["input_method", "key"]
 
@@ -94,7 +128,16 @@ class KeyBinding:
 
     @property
     def category_title(self) -> str:
-        return self.category.replace("_", " ").title()
+        return self.to_category_title(self.category)
+
+    @staticmethod
+    def to_category_title(category: str) -> str:
+        return category.replace("_", " ").title()
+
+    @staticmethod
+    def entry_category_title(entry) -> str:
+        # same category as `from_entry()`, without building the key binding.
+        return KeyBinding.to_category_title(entry.get("category", "General"))
 
     @classmethod
     def from_entry(cls, entry) -> "KeyBinding":
@@ -112,21 +155,21 @@ class KeyBinding:
             d.update({"name": name})
         return cls(**d)
 
-    def to_latex(self, is_last_entry: bool) -> List[str]:
+    def to_latex(self, is_last_entry: bool, escaped_name: Optional[str] = None) -> List[str]:
         binding_strings: List[str] = list()
         end_line = '\\\\' if is_last_entry else '\\hlx'
+        name = escaped_name if escaped_name is not None else escape_latex_text(self.name)
 
         if len(self.bindings) <= 1:
             # one or zero bindings.
             bindings = self.bindings[0].to_latex() if self.bindings else "<unbound> & <unbound>"
-            name = escape_latex_text(self.name)
             binding_strings.append(f"{name} & {bindings} {end_line}")
         else:
             # multi bindings for the same entry. It's touchy because of the row colors.
             for i, binding in enumerate(self.bindings):
                 # next_binding = self.bindings[i + 1] if i < len(self.bindings) else None
                 if i == len(self.bindings) - 1:  # last binding
-                    col = r"\multirow{-%i}{*}{%s}" % (len(self.bindings), escape_latex_text(self.name))
+                    col = r"\multirow{-%i}{*}{%s}" % (len(self.bindings), name)
                     binding_strings.append(f"{col} & {binding.to_latex()} {end_line}")
                 else:
                     binding_strings.append(f"& {binding.to_latex()} \\\\")
@@ -134,24 +177,71 @@ class KeyBinding:
         return binding_strings
 
 
+class RenderCache:
+    # Content addressed cache of rendered categories: one '<key>.tex' file per rendered category, where the key is a
+    # hash of everything the rendering depends on (see `KeyBindingContainer.category_cache_key`).
+    def __init__(self, cache_dir: pathlib.Path) -> None:
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            content = (self.cache_dir / f"{key}.tex").read_text(encoding="utf-8")
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+
+    def put(self, key: str, content: str) -> None:
+        atomic_write_text(self.cache_dir / f"{key}.tex", content)
+
+
 class KeyBindingContainer:
     MAX_LINES = 50
     TAB_SPACES = 12
+    RENDER_VERSION = 1  # bump when the latex output changes; invalidates the render cache.
 
-    def __init__(self, json_data: JsonDataType):
-        self.key_binding_categories: Dict[str: List[KeyBinding]] = dict()
+    def __init__(self, json_data: JsonDataType, render_cache: Optional[RenderCache] = None):
+        # raw entries per category; key bindings are only built for the categories that must be rendered.
+        self._category_entries: Dict[str, JsonDataType] = dict()
         for entry in json_data:
-            key_binding_entry = KeyBinding.from_entry(entry)
-            if not self.key_binding_categories.get(key_binding_entry.category_title):
-                self.key_binding_categories[key_binding_entry.category_title] = list()
-            self.key_binding_categories[key_binding_entry.category_title].append(key_binding_entry)
-
-        # sort entries by name
-        for k, v in self.key_binding_categories.items():
-            v.sort(key=lambda e: e.name)
+            self._category_entries.setdefault(KeyBinding.entry_category_title(entry), list()).append(entry)
+        self._key_binding_categories: Dict[str, List[KeyBinding]] = dict()
+        self.render_cache = render_cache
 
         self._colors = ["white", "gray!10"]  # alternating colors for rows.
 
+    @property
+    def key_binding_categories(self) -> Dict[str, List[KeyBinding]]:
+        for category_name in self._category_entries:
+            self.category_key_bindings(category_name)
+        return self._key_binding_categories
+
+    def category_key_bindings(self, category_name: str) -> List[KeyBinding]:
+        key_bindings = self._key_binding_categories.get(category_name)
+        if key_bindings is None:
+            key_bindings = [KeyBinding.from_entry(entry) for entry in self._category_entries[category_name]]
+            # sort entries by name
+            key_bindings.sort(key=lambda e: e.name)
+            self._key_binding_categories[category_name] = key_bindings
+        return key_bindings
+
+    def category_cache_key(self, category_name: str) -> str:
+        settings = {
+            "version": self.RENDER_VERSION,
+            "category": category_name,
+            "max_lines": self.MAX_LINES,
+            "tab_spaces": self.TAB_SPACES,
+            "max_name_line_length": KeyBinding.MAX_NAME_LINE_LENGTH,
+            "colors": self._colors,
+        }
+        # entries are hashed in their input order: the (stable) sort by name depends on it.
+        content = json.dumps([settings, self._category_entries[category_name]], sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
     def generate_table_header(self, category_name: str, is_continuation: bool, add_comment_separator: bool = True):
         table_header_strings = [
             "%\n% {cat_name}\n%".format(cat_name=category_name),
@@ -208,8 +298,9 @@ class KeyBindingContainer:
         ]
         return '\n'.join(table_footer_strings)
 
-    def generate_entry(self, entry: KeyBinding, is_last_entry: bool, entry_tab: int, starting_color: str) -> str:
-        entry_strings: List[str] = entry.to_latex(is_last_entry)
+    def generate_entry(self, entry: KeyBinding, is_last_entry: bool, entry_tab: int, starting_color: str,
+                       escaped_name: Optional[str] = None) -> str:
+        entry_strings: List[str] = entry.to_latex(is_last_entry, escaped_name)
         output_strings: List[str] = list()
         for i, entry_string in enumerate(entry_strings):
             # row color
@@ -219,7 +310,8 @@ class KeyBindingContainer:
         return '\n'.join(output_strings)
 
     def generate_table_entries(self, category_name: str) -> str:
-        entries: List[KeyBinding] = self.key_binding_categories[category_name]
+        entries: List[KeyBinding] = self.category_key_bindings(category_name)
+        escaped_names = escape_latex_column([e.name for e in entries])
         entry_strings: List[str] = list()
 
         total_lines = 0
@@ -232,18 +324,28 @@ class KeyBindingContainer:
             total_lines += entry_num_text_lines
             is_last_entry = i == len(entries) - 1
             starting_color = self._colors[i % len(self._colors)]
-            entry_string = self.generate_entry(e, is_last_entry, self.TAB_SPACES, starting_color)
+            entry_string = self.generate_entry(e, is_last_entry, self.TAB_SPACES, starting_color, escaped_names[i])
             entry_strings.append(entry_string)
 
         if entry_strings:
             yield "\n".join(entry_strings)
 
     def generate_latex_tables(self) -> str:
-        sorted_categories = sorted(e for e in self.key_binding_categories.keys())
+        sorted_categories = sorted(e for e in self._category_entries.keys())
         for category in sorted_categories:
             yield self.category_to_latex_table(category)
 
     def category_to_latex_table(self, category_name: str) -> str:
+        if self.render_cache is None:
+            return self.render_category(category_name)
+        key = self.category_cache_key(category_name)
+        table = self.render_cache.get(key)
+        if table is None:
+            table = self.render_category(category_name)
+            self.render_cache.put(key, table)
+        return table
+
+    def render_category(self, category_name: str) -> str:
         generated_tables = list()
         for i, string_entries in enumerate(self.generate_table_entries(category_name)):
             table_header = self.generate_table_header(category_name, i != 0, i == 0)
@@ -256,6 +358,159 @@ class KeyBindingContainer:
         return '\n'.join(generated_tables)
 
 
+def has_keybindings(file_path: pathlib.Path) -> bool:
+    # cheap pre-filter for directory scans: a byte search of the (memory mapped) file, no json decoding.
+    with file_path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped.find(KEYBINDING_TYPE_MARKER) != -1
+
+
+def find_input_files(input_path: pathlib.Path) -> List[Tuple[pathlib.Path, bool]]:
+    # (json file path, whether only the keybinding entries are kept) for a file or a directory (e.g. 'data/mods').
+    # Files given explicitly are loaded whole; files found in directories are filtered on their entry type.
+    if not input_path.is_dir():
+        return [(input_path, False)]
+    return [(file_path, True) for file_path in sorted(input_path.rglob("*.json")) if has_keybindings(file_path)]
+
+
+def load_input_file(file_path: pathlib.Path, keybindings_only: bool) -> JsonDataType:
+    with file_path.open("r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = [entries]
+    if keybindings_only:
+        return [e for e in entries if isinstance(e, dict) and e.get("type") == KEYBINDING_TYPE]
+    return entries
+
+
+def load_inputs(input_paths: List[pathlib.Path], jobs: int = 1) -> Iterator[Tuple[pathlib.Path, JsonDataType]]:
+    # Yields (file path, entries) for each input file, in the input order. With more than one job, many or large
+    # files are decoded in parallel by a pool of processes (json decoding holds the GIL).
+    input_files = [input_file for input_path in input_paths for input_file in find_input_files(input_path)]
+    input_size = sum(file_path.stat().st_size for (file_path, _) in input_files)
+    if jobs <= 1 or len(input_files) <= 1 or input_size < POOL_MIN_INPUT_SIZE:
+        for file_path, keybindings_only in input_files:
+            yield file_path, load_input_file(file_path, keybindings_only)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        file_paths = [file_path for (file_path, _) in input_files]
+        keybindings_only = [k for (_, k) in input_files]
+        yield from zip(file_paths, executor.map(load_input_file, file_paths, keybindings_only))
+
+
+class Override(NamedTuple):
+    category: str
+    id: str
+    overridden_by: pathlib.Path  # file of the new entry.
+    previous: pathlib.Path  # file of the replaced entry.
+
+
+def merge_inputs(inputs: Iterable[Tuple[pathlib.Path, JsonDataType]]) -> Tuple[JsonDataType, List[Override]]:
+    # Single pass merge of the input files, as done by the game: an entry is identified by its (category, id), a later
+    # entry replaces an earlier one with the same identity (keeping its position), new entries are appended.
+    merged: Dict[Tuple[str, str], Dict] = dict()
+    sources: Dict[Tuple[str, str], pathlib.Path] = dict()
+    overrides: List[Override] = list()
+    for file_path, entries in inputs:
+        for entry in entries:
+            key = (entry.get("category", "General"), entry["id"])
+            previous = sources.get(key)
+            if previous is not None:
+                overrides.append(Override(key[0], key[1], file_path, previous))
+            merged[key] = entry
+            sources[key] = file_path
+    return list(merged.values()), overrides
+
+
+def normalize_key(input_method: str, key: str) -> str:
+    return key.lower() if input_method in CASE_INSENSITIVE_INPUT_METHODS else key
+
+
+class Conflict(NamedTuple):
+    context: str  # category title, or categories active together ('A + B').
+    input_method: str  # or input methods, comma separated.
+    key: str
+    actions: List[Tuple[str, str]]  # (category title, id) of the actions bound to the key.
+
+
+def find_conflicts(container: KeyBindingContainer,
+                   active_together: Iterable[Iterable[str]] = ()) -> List[Conflict]:
+    # Single pass over all the bindings, indexed by (context, input method, normalized key). Each category is its own
+    # context; each group of categories active together is one more context, in which only the conflicts between
+    # different categories are reported (the others already are in their own category).
+    contexts: Dict[str, List[str]] = {category: [category] for category in container.key_binding_categories}
+    for group in active_together:
+        titles = [KeyBinding.to_category_title(category) for category in group]
+        for title in titles:
+            contexts.setdefault(title, [title]).append(" + ".join(titles))
+    group_contexts = {context for context_list in contexts.values() for context in context_list[1:]}
+
+    # index values: (category title, id) of each action bound to the key -> input methods of its bindings.
+    index: Dict[Tuple[str, str, str], Dict[Tuple[str, str], Set[str]]] = dict()
+    for category, key_bindings in container.key_binding_categories.items():
+        for key_binding in key_bindings:
+            for binding in key_binding.bindings:
+                if not binding.key:
+                    continue
+                for input_method in INPUT_METHOD_ALIASES.get(binding.input_method, (binding.input_method,)):
+                    key = normalize_key(input_method, binding.key)
+                    for context in contexts[category]:
+                        # an action bound twice to the same key isn't a conflict.
+                        actions = index.setdefault((context, input_method, key), dict())
+                        actions.setdefault((category, key_binding.id), set()).add(binding.input_method)
+
+    # a clash between 'keyboard_any' bindings only is found under both keyboard input methods: it's reported once,
+    # with both input methods. Any other clash is reported as is (e.g. 'keyboard_char' 'e' and 'E' are two clashes).
+    conflicts: List[Conflict] = list()
+    alias_conflicts: Dict[Tuple[str, str, FrozenSet[Tuple[str, str]]], List[int]] = dict()
+    for (context, input_method, key), actions in index.items():
+        if len(actions) < 2:
+            continue
+        if context in group_contexts and len({category for (category, _) in actions}) < 2:
+            continue
+        conflict = Conflict(context, input_method, key, list(actions))
+        if not all(origins.issubset(INPUT_METHOD_ALIASES) for origins in actions.values()):
+            conflicts.append(conflict)
+            continue
+        same_clash = alias_conflicts.setdefault((context, key.lower(), frozenset(actions)), list())
+        for i in same_clash:
+            if input_method not in conflicts[i].input_method.split(", "):
+                conflicts[i] = conflicts[i]._replace(input_method=f"{conflicts[i].input_method}, {input_method}")
+                break
+        else:
+            same_clash.append(len(conflicts))
+            conflicts.append(conflict)
+    return conflicts
+
+
+def print_conflicts(conflicts: List[Conflict]) -> None:
+    for conflict in sorted(conflicts, key=lambda c: (c.context, c.key, c.input_method)):
+        actions = ", ".join(f"{category}/{action_id}" for (category, action_id) in conflict.actions)
+        print(f"{conflict.context}: '{conflict.key}' ({conflict.input_method}) -> {actions}")
+    print(f"{len(conflicts)} conflicts.")
+
+
+def generate_latex_document(json_data: JsonDataType, template: str, render_cache: Optional[RenderCache] = None) -> str:
+    # display a few info
+    total_keys = sum([len(e['bindings']) if e.get("bindings") else 0 for e in json_data])
+    unbound_entries = sum([1 if e.get("bindings") is None else 0 for e in json_data])
+    logger.info(f"Found {len(json_data)} entries; total keys: {total_keys}; unbound entries: {unbound_entries}")
+
+    # parse everything
+    logger.info("Parsing json entries.")
+    k_container = KeyBindingContainer(json_data, render_cache)
+
+    # generate latex
+    logger.info("Generating latex output.")
+    output = '\n'.join(latex_table for latex_table in k_container.generate_latex_tables())
+    if render_cache is not None:
+        logger.info(f"Render cache: {render_cache.hits} categories reused, {render_cache.misses} rendered.")
+    return template.replace(r"%{template}", output)
+
+
 def main(args):
     file_paths: List[pathlib.Path] = list()
 
@@ -265,26 +520,35 @@ def main(args):
         return -1
     file_paths.append(args.keybindings)
 
-    # additional input file(s)
+    # additional input file(s) or directories.
     if args.additional_input:
         args.additional_input = [pathlib.Path(p) for p in args.additional_input]
         has_error = False
         for additional_file_path in args.additional_input:
-            if not additional_file_path.is_file():
+            if not additional_file_path.is_file() and not additional_file_path.is_dir():
                 has_error = True
-                logger.error(f"The given additional json input file path '{additional_file_path}' "
-                             f"is not a file or does not exist.")
+                logger.error(f"The given additional json input path '{additional_file_path}' "
+                             f"is not a file or a directory, or does not exist.")
             else:
                 file_paths.append(additional_file_path)
 
         if has_error:
             return -1
 
-    # read json from all input files
-    json_data = list()
-    for file_path in file_paths:
-        with file_path.open("r") as f:
-            json_data.extend(json.load(f))
+    # read json from all input files; later files override the entries of the previous ones.
+    json_data, overrides = merge_inputs(load_inputs(file_paths, args.jobs))
+    logger.info(f"{len(overrides)} entries overridden by later input files.")
+    if args.override_report:
+        with args.override_report.open("w", encoding="utf-8") as report_f:
+            for override in overrides:
+                report_f.write(f"{override.category}/{override.id}: {override.previous!s} -> "
+                               f"{override.overridden_by!s}\n")
+        logger.info(f"Override report written to: {args.override_report!s}")
+
+    if args.check_conflicts:
+        conflicts = find_conflicts(KeyBindingContainer(json_data), args.active_together)
+        print_conflicts(conflicts)
+        return 1 if conflicts else 0
 
     # read latex template file.
     template_file: pathlib.Path = args.template
@@ -295,20 +559,9 @@ def main(args):
     with template_file.open("r") as template_f:
         template = template_f.read()
 
-    # display a few info
-    total_keys = sum([len(e['bindings']) if e.get("bindings") else 0 for e in json_data])
-    unbound_entries = sum([1 if e.get("bindings") is None else 0 for e in json_data])
-    logger.info(f"Found {len(json_data)} entries; total keys: {total_keys}; unbound entries: {unbound_entries}")
-
-    # parse everything
-    logger.info("Parsing json entries.")
-    k_container = KeyBindingContainer(json_data)
-
-    # generate latex
-    logger.info("Generating latex output.")
-    output = '\n'.join(latex_table for latex_table in k_container.generate_latex_tables())
+    render_cache = RenderCache(args.cache_dir) if args.cache_dir else None
+    latex_output = generate_latex_document(json_data, template, render_cache)
     with args.output.open("w") as out_f:
-        latex_output = template.replace(r"%{template}", output)
         logger.info(f"Writing output file: {args.output!s}")
         out_f.write(latex_output)
 
@@ -327,7 +580,23 @@ if __name__ == "__main__":
                             help="Path to CDDA keybindings.json input file.")
 
     arg_parser.add_argument("-a", action="append", dest="additional_input", default=[],
-                            help="Add other input files to input.")
+                            help="Add other input files to input; directories (e.g. 'data/mods') are scanned for "
+                                 "json files with keybindings.")
+
+    arg_parser.add_argument("--override-report", type=pathlib.Path, action="store", default=None,
+                            help="Write the list of entries overridden by later input files, and by which file.")
+
+    arg_parser.add_argument("--check-conflicts", action="store_true",
+                            help="Only report the keys bound to more than one action in the same context; exits with "
+                                 "1 if there's any conflict.")
+
+    arg_parser.add_argument("--active-together", type=lambda text: text.split(","), action="append", default=[],
+                            help="Comma separated categories active at the same time (e.g. 'DEFAULTMODE,LOOK'); "
+                                 "conflicts between them are reported too. Can be repeated.")
+
+    arg_parser.add_argument("-j", "--jobs", type=int, action="store", default=1,
+                            help="Number of processes loading the input files, when there are many or large files "
+                                 "(default: 1).")
 
     arg_parser.add_argument("-o", "--output",
                             type=pathlib.Path, action="store", default="./cdda_keybindings.tex",
@@ -337,6 +606,10 @@ if __name__ == "__main__":
                             default="./cdda_keybindings_template.tex",
                             help="Template path.")
 
+    arg_parser.add_argument("-c", "--cache-dir", type=pathlib.Path, action="store", default=None,
+                            help="Directory of the rendered categories cache; unchanged categories aren't rendered "
+                                 "again. Disabled if unset.")
+
     parsed_args = arg_parser.parse_args()
 
     logging_level = logging.getLevelName(parsed_args.log_level)
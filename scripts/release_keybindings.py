@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import functools
+import io
+import json
+import logging
+import pathlib
+import sys
+import tarfile
+import tempfile
+import zipfile
+from typing import IO, List, NamedTuple, Optional
+
+import requests
+
+import cdda_releases
+import generate_keybindings_doc
+
+logger = logging.getLogger(__name__)
+
+# path of the keybindings file inside a game archive; archives may have a top level directory (e.g. tarballs).
+KEYBINDINGS_MEMBER = "data/raw/keybindings.json"
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.xz", ".tar.bz2")
+RANGE_BLOCK_SIZE = 256 * 1024  # minimum size of a range request; zipfile does many small reads.
+SPOOL_MAX_SIZE = 64 * 1024 * 1024  # downloaded zip archives are kept in memory up to this size, on disk above.
+
+
+def is_keybindings_member(name: str) -> bool:
+    return name == KEYBINDINGS_MEMBER or name.endswith("/" + KEYBINDINGS_MEMBER)
+
+
+def archive_type(name: str) -> Optional[str]:
+    lower_name = name.lower()
+    if lower_name.endswith(ZIP_SUFFIXES):
+        return "zip"
+    if lower_name.endswith(TAR_SUFFIXES):
+        return "tar"
+    return None
+
+
+def archive_stem(name: str) -> str:
+    lower_name = name.lower()
+    for suffix in ZIP_SUFFIXES + TAR_SUFFIXES:
+        if lower_name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class RangeNotSupportedError(RuntimeError):
+    pass
+
+
+class HttpRangeFile(io.RawIOBase):
+    # Read-only, seekable view of a remote file: each read is an HTTP Range request. Reads are rounded up to
+    # `RANGE_BLOCK_SIZE` and the last block is kept, so that zipfile only needs a handful of requests to locate and
+    # read a single member (end of central directory, central directory, member).
+    def __init__(self, url: str, session: requests.Session) -> None:
+        super().__init__()
+        self._session = session
+        # no transfer encoding, or the byte ranges would apply to the compressed content.
+        self._headers = {"Accept-Encoding": "identity"}
+        response = session.head(url, headers=self._headers, allow_redirects=True, timeout=cdda_releases.REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            raise cdda_releases.PageFetchError(f"Error requesting url: {response.status_code} - url: {url}",
+                                               response.status_code, response.headers)
+        if response.headers.get("accept-ranges") != "bytes" or "content-length" not in response.headers:
+            raise RangeNotSupportedError(f"The server doesn't support range requests for: {url}")
+        # GitHub asset urls redirect to a (temporary) signed url: the ranges are requested from the final one.
+        self.url = response.url
+        self.size = int(response.headers["content-length"])
+        self._position = 0
+        self._block_start = 0
+        self._block = b""
+        self.num_requests = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        headers = dict(self._headers, Range=f"bytes={start}-{end - 1}")
+        response = self._session.get(self.url, headers=headers, timeout=cdda_releases.REQUEST_TIMEOUT)
+        self.num_requests += 1
+        cdda_releases.metrics.inc("range_requests_total", status=response.status_code)
+        if response.status_code != 206:
+            raise cdda_releases.PageFetchError(f"Error requesting range: {response.status_code} - url: {self.url}",
+                                               response.status_code, response.headers)
+        return response.content
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.size - self._position
+        end = min(self.size, self._position + size)
+        if self._position >= end:
+            return b""
+        block_end = self._block_start + len(self._block)
+        if not (self._block_start <= self._position and end <= block_end):
+            block_end = min(self.size, max(end, self._position + RANGE_BLOCK_SIZE))
+            self._block = self._fetch(self._position, block_end)
+            self._block_start = self._position
+        data = self._block[self._position - self._block_start:end - self._block_start]
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_zip_member(fileobj: IO[bytes]) -> Optional[bytes]:
+    # random access: only the central directory and the member itself are read.
+    with zipfile.ZipFile(fileobj) as archive:
+        for name in archive.namelist():
+            if is_keybindings_member(name):
+                return archive.read(name)
+    return None
+
+
+def read_tar_member(fileobj: IO[bytes]) -> Optional[bytes]:
+    # tarballs have no index: scan the (decompressed) stream, stopping at the member; nothing is written to disk.
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and is_keybindings_member(member.name):
+                return archive.extractfile(member).read()
+    return None
+
+
+def read_keybindings(fileobj: IO[bytes], kind: str) -> Optional[generate_keybindings_doc.JsonDataType]:
+    # None if the archive has no keybindings file (e.g. a source or data only archive).
+    content = read_zip_member(fileobj) if kind == "zip" else read_tar_member(fileobj)
+    return json.loads(content.decode("utf-8")) if content is not None else None
+
+
+class ArchiveSource(NamedTuple):
+    # a game archive: a local file, or a release asset (local mirror copy if any, download url otherwise).
+    name: str
+    path: Optional[pathlib.Path] = None
+    url: Optional[str] = None
+
+    def __str__(self) -> str:
+        return self.name
+
+
+def load_archive_keybindings(source: ArchiveSource,
+                             session: requests.Session) -> Optional[generate_keybindings_doc.JsonDataType]:
+    kind = archive_type(source.path.name if source.path is not None else source.url)
+    with cdda_releases.metrics.time_stage("extract"):
+        if source.path is not None:
+            with source.path.open("rb") as f:
+                return read_keybindings(f, kind)
+        if kind == "zip":
+            try:
+                return read_keybindings(HttpRangeFile(source.url, session), kind)
+            except RangeNotSupportedError as e:
+                logger.warning(f"{e}; downloading the whole archive.")
+        headers = {"Accept-Encoding": "identity"}
+        with session.get(source.url, headers=headers, stream=True, timeout=cdda_releases.REQUEST_TIMEOUT) as response:
+            if response.status_code != 200:
+                raise cdda_releases.PageFetchError(f"Error requesting url: {response.status_code} - url: {source.url}",
+                                                   response.status_code, response.headers)
+            if kind == "tar":
+                # the scan stops at the member: the rest of the archive is never downloaded.
+                return read_keybindings(response.raw, kind)
+            # zip members are found from the end of the archive: it must be downloaded first.
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as f:
+                for chunk in response.iter_content(cdda_releases.CHUNK_SIZE):
+                    f.write(chunk)
+                f.seek(0)
+                return read_keybindings(f, kind)
+
+
+def load_source_keybindings(source: ArchiveSource,
+                            session: requests.Session) -> Optional[generate_keybindings_doc.JsonDataType]:
+    # a permanent error (e.g. a removed asset) only fails its own archive; transient errors go back to the scheduler.
+    try:
+        json_data = load_archive_keybindings(source, session)
+    except cdda_releases.PageFetchError as e:
+        if e.is_transient:
+            raise
+        logger.error(f"Failed to load the keybindings of '{source}': {e}")
+        return None
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        logger.error(f"Failed to read the archive of '{source}': {e}")
+        return None
+    if json_data is None:
+        logger.warning(f"No '{KEYBINDINGS_MEMBER}' in the archive of '{source}'; skipped.")
+    return json_data
+
+
+def select_release_archive(release: cdda_releases.Release, os_names: Optional[List[str]],
+                           mirror_dir: Optional[pathlib.Path]) -> Optional[ArchiveSource]:
+    # zip archives first: their member can be read with a few range requests, tarballs must be scanned.
+    assets = [a for a in release.assets if archive_type(a.name) and cdda_releases.asset_matches(a, os_names)]
+    assets.sort(key=lambda a: archive_type(a.name) != "zip")
+    if mirror_dir is not None:
+        for asset in assets:
+            path = mirror_dir / release.tag_name / asset.name
+            if path.is_file():
+                return ArchiveSource(release.tag_name, path=path)
+    for asset in assets:
+        if asset.url:
+            return ArchiveSource(release.tag_name, url=asset.url)
+    return None
+
+
+def find_release_archives(args) -> List[ArchiveSource]:
+    owner, repository = args.repository
+    release_filter = cdda_releases.ReleaseFilter(tag_pattern=args.tag_pattern)
+    with cdda_releases.RequestScheduler(args.workers, max_retries=args.retries) as scheduler:
+        # releases are newest first: only the pages holding the `latest` releases are fetched.
+        page_loader = cdda_releases.PageLoader(owner, repository, workers=args.workers, scheduler=scheduler,
+                                               release_filter=release_filter if release_filter else None,
+                                               max_releases=args.latest)
+        page_loader.parse_releases()
+
+    sources = list()
+    for release in page_loader.releases:
+        source = select_release_archive(release, args.os, args.mirror_dir)
+        if source is None:
+            logger.warning(f"No zip or tar archive in release {release.tag_name}.")
+            continue
+        sources.append(source)
+    return sources
+
+
+def main(args):
+    if args.archives:
+        sources = list()
+        for path in args.archives:
+            if not path.is_file() or archive_type(path.name) is None:
+                logger.error(f"The given archive path '{path}' is not a zip or tar file or does not exist.")
+                return -1
+            sources.append(ArchiveSource(archive_stem(path.name), path=path))
+    else:
+        sources = find_release_archives(args)
+
+    template_file: pathlib.Path = args.template
+    if not template_file.is_file():
+        logger.error(f"The given .tex input template file path '{template_file}' is not a file or does not exist.")
+        return -1
+    template = template_file.read_text()
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    # most categories don't change between versions: they are only rendered once.
+    render_cache = generate_keybindings_doc.RenderCache(args.cache_dir) if args.cache_dir else None
+    session = cdda_releases.create_session(args.workers)
+    num_failed = 0
+    with cdda_releases.RequestScheduler(args.workers, max_retries=args.retries) as scheduler:
+        load = functools.partial(load_source_keybindings, session=session)
+        for source, json_data in scheduler.map(load, sources):
+            if json_data is None:
+                # already logged.
+                num_failed += 1
+                continue
+            output_path = args.output / f"{source.name}.tex"
+            logger.info(f"Writing output file: {output_path!s}")
+            latex_output = generate_keybindings_doc.generate_latex_document(json_data, template, render_cache)
+            output_path.write_text(latex_output)
+
+    if num_failed:
+        logger.error(f"No cheat sheet for {num_failed} of {len(sources)} archives.")
+        return -1
+    logger.info("Done!")
+    return 0
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generate keybinding cheat sheets straight from game archives.")
+
+    arg_parser.add_argument("-l", "--log-level",
+                            choices=['NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], default='INFO',
+                            help="Set the logging level.")
+
+    arg_parser.add_argument("archives", type=pathlib.Path, nargs="*",
+                            help="Local game archives (zip or tar). If none, the release archives are used.")
+
+    arg_parser.add_argument("-r", "--repo", type=cdda_releases.parse_repository, dest="repository",
+                            default=(cdda_releases.OWNER, cdda_releases.REPO),
+                            help=f"'owner/repository' of the releases. Default: {cdda_releases.OWNER}/"
+                                 f"{cdda_releases.REPO}.")
+
+    arg_parser.add_argument("-n", "--latest", type=int, default=1,
+                            help="Number of (most recent) releases to generate a cheat sheet for.")
+
+    arg_parser.add_argument("--tag-pattern", type=str, default=None,
+                            help="Only releases whose tag matches this shell-style pattern (e.g. 'cdda-0.G*').")
+
+    arg_parser.add_argument("--os", choices=list(cdda_releases.OS_FLAGS.keys()), nargs="+", default=None,
+                            help="Only use archives for these OSes.")
+
+    arg_parser.add_argument("-m", "--mirror-dir", type=pathlib.Path, default=None,
+                            help="Local mirror (see 'cdda_releases.py mirror'); archives found there aren't fetched.")
+
+    arg_parser.add_argument("-c", "--cache-dir", type=pathlib.Path, default=None,
+                            help="Directory of the rendered categories cache (see generate_keybindings_doc.py).")
+
+    arg_parser.add_argument("-w", "--workers", type=int, default=4, help="Number of archives processed concurrently.")
+
+    arg_parser.add_argument("--retries", type=int, default=5, help="Maximum number of retries of a request.")
+
+    arg_parser.add_argument("-o", "--output", type=pathlib.Path, default="./cheat_sheets",
+                            help="Output directory; one latex file per archive.")
+
+    arg_parser.add_argument("-t", "--template", type=pathlib.Path, action="store",
+                            default="./cdda_keybindings_template.tex",
+                            help="Template path.")
+
+    parsed_args = arg_parser.parse_args()
+
+    logging_level = logging.getLevelName(parsed_args.log_level)
+    logging.basicConfig(level=logging_level)
+    logger.setLevel(logging_level)
+
+    sys.exit(main(parsed_args))
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import sys
+
+# the tools are standalone scripts, not a package.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "scripts"))
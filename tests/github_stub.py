@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import http.server
+import json
+import threading
+import time
+import unittest
+import urllib.parse
+from typing import Dict, List, Optional
+
+import cdda_releases
+
+PER_PAGE = cdda_releases.PER_PAGE
+
+
+class StubGitHub:
+    # Local stand-in of the GitHub API (release pages, with 'link' headers and ETags) and of the asset download
+    # server (ETag, Range and If-Range). Errors can be scheduled for each page.
+    def __init__(self, num_releases: int) -> None:
+        self.files: Dict[str, bytes] = dict()  # path -> content.
+        self.accept_ranges = True  # unset: the download server ignores Range headers and doesn't advertise them.
+        self.page_delay = 0.0  # seconds each page request takes.
+        self.max_concurrent_pages = 0  # largest number of page requests served at the same time.
+        self._concurrent_pages = 0
+        self.fail_plan: Dict[int, List[Dict]] = dict()  # page number -> error responses, sent first.
+        self.requests: List[Dict] = list()  # (path, page, status, headers) of each request.
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self.url_template = self.base_url + "/repos/{owner}/{repository}/releases"
+        self.releases = [self._make_release(i) for i in range(num_releases)]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_release(self, i: int) -> Dict:
+        tag = f"cdda-experimental-2024-01-{i:05d}"
+        assets = list()
+        for j, template in enumerate(("cdda-windows-tiles-x64-{}.zip", "cdda-linux-curses-x64-{}.tar.gz")):
+            name = template.format(tag)
+            content = f"{name}\n".encode("utf-8") * (2000 + i)
+            path = f"/files/{tag}/{name}"
+            self.files[path] = content
+            assets.append({
+                "id": i * 10 + j,
+                "name": name,
+                "label": "",
+                "download_count": i + j,
+                "size": len(content),
+                "browser_download_url": self.base_url + path,
+                "digest": "sha256:" + hashlib.sha256(content).hexdigest(),
+                "uploader": {"login": "bot"},
+            })
+        published_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1700000000 - i * 3600))
+        return {"id": 100000 - i, "tag_name": tag, "name": tag, "published_at": published_at, "prerelease": True,
+                "body": "changelog", "assets": assets}
+
+    def page_requests(self, page_num: int) -> List[Dict]:
+        return [r for r in self.requests if r["page"] == page_num]
+
+    def _log(self, path: str, page: Optional[int], status: int, headers) -> None:
+        with self._lock:
+            self.requests.append({"path": path, "page": page, "status": status, "headers": dict(headers)})
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                for k, v in (headers or dict()).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self) -> None:
+                content = stub.files.get(self.path)
+                stub._log(self.path, None, 200 if content is not None else 404, self.headers)
+                self.send_response(200 if content is not None else 404)
+                if stub.accept_ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(len(content) if content is not None else 0))
+                self.end_headers()
+
+            def do_GET(self) -> None:
+                url = urllib.parse.urlparse(self.path)
+                if url.path.startswith("/files/"):
+                    self._get_file(url.path)
+                else:
+                    self._get_page(url)
+
+            def _get_page(self, url) -> None:
+                query = dict(urllib.parse.parse_qsl(url.query))
+                page_num = int(query.get("page", 1))
+                with stub._lock:
+                    plan = stub.fail_plan.get(page_num)
+                    error = plan.pop(0) if plan else None
+                    stub._concurrent_pages += 1
+                    stub.max_concurrent_pages = max(stub.max_concurrent_pages, stub._concurrent_pages)
+                try:
+                    time.sleep(stub.page_delay)
+                    self._send_page(url, page_num, error)
+                finally:
+                    with stub._lock:
+                        stub._concurrent_pages -= 1
+
+            def _send_page(self, url, page_num: int, error: Optional[Dict]) -> None:
+                if error is not None:
+                    stub._log(url.path, page_num, error["status"], self.headers)
+                    self._send(error["status"], b'{"message": "error"}', error.get("headers"))
+                    return
+
+                last_page = max(1, -(-len(stub.releases) // PER_PAGE))
+                body = json.dumps(stub.releases[(page_num - 1) * PER_PAGE:page_num * PER_PAGE]).encode("utf-8")
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                headers = {"ETag": etag, "X-RateLimit-Remaining": "4000",
+                           "X-RateLimit-Reset": str(int(time.time()) + 3600)}
+                if page_num < last_page:
+                    base = f"{stub.base_url}{url.path}?per_page={PER_PAGE}"
+                    headers["Link"] = f'<{base}&page={page_num + 1}>; rel="next", <{base}&page={last_page}>; rel="last"'
+                if self.headers.get("If-None-Match") == etag:
+                    stub._log(url.path, page_num, 304, self.headers)
+                    self._send(304, headers=headers)
+                    return
+                stub._log(url.path, page_num, 200, self.headers)
+                self._send(200, body, headers)
+
+            def _get_file(self, path: str) -> None:
+                content = stub.files.get(path)
+                if content is None:
+                    stub._log(path, None, 404, self.headers)
+                    self._send(404)
+                    return
+                etag = '"%s"' % hashlib.md5(content).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    stub._log(path, None, 304, self.headers)
+                    self._send(304, headers={"ETag": etag})
+                    return
+                byte_range = self.headers.get("Range")
+                if stub.accept_ranges and byte_range and self.headers.get("If-Range", etag) == etag:
+                    start, _, end = byte_range.partition("=")[2].partition("-")
+                    start, end = int(start), min(int(end) if end else len(content) - 1, len(content) - 1)
+                    if start >= len(content):
+                        stub._log(path, None, 416, self.headers)
+                        self._send(416, headers={"Content-Range": f"bytes */{len(content)}"})
+                        return
+                    stub._log(path, None, 206, self.headers)
+                    self._send(206, content[start:end + 1], {"ETag": etag,
+                                                             "Content-Range": f"bytes {start}-{end}/{len(content)}"})
+                    return
+                stub._log(path, None, 200, self.headers)
+                self._send(200, content, {"ETag": etag})
+
+        return Handler
+
+
+class StubTestCase(unittest.TestCase):
+    NUM_RELEASES = 3 * PER_PAGE + 10  # 4 pages.
+
+    def setUp(self) -> None:
+        self.stub = StubGitHub(self.NUM_RELEASES)
+        self.addCleanup(self.stub.close)
+        self.scheduler = cdda_releases.RequestScheduler(workers=3, max_retries=3, backoff=0.01, max_backoff=0.05)
+        self.addCleanup(self.scheduler.close)
+
+    def make_page_loader(self, **kwargs) -> cdda_releases.PageLoader:
+        return cdda_releases.PageLoader("owner", "repo", workers=3, scheduler=self.scheduler,
+                                        url_template=self.stub.url_template, **kwargs)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import tempfile
+import unittest
+from typing import Dict, List
+
+import cdda_releases
+from github_stub import StubTestCase
+
+
+class AssetMirrorTest(StubTestCase):
+    NUM_RELEASES = 3
+
+    def setUp(self) -> None:
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.mirror_dir = pathlib.Path(tmp_dir.name)
+        self.mirror = cdda_releases.AssetMirror(self.mirror_dir)
+        self.items = [cdda_releases.MirrorItem(release, asset) for release in self.load_releases()
+                      for asset in release.assets]
+
+    def load_releases(self) -> List[cdda_releases.Release]:
+        page_loader = self.make_page_loader()
+        page_loader.parse_releases()
+        return page_loader.releases
+
+    def file_requests(self) -> List[Dict]:
+        return [r for r in self.stub.requests if r["path"].startswith("/files/")]
+
+    def assert_mirrored(self) -> None:
+        for item in self.items:
+            path = self.mirror.asset_path(item.release, item.asset)
+            self.assertEqual(path.read_bytes(), self.stub.files[f"/files/{item.release.tag_name}/{item.asset.name}"])
+
+    def test_download_then_skip_unchanged_files(self) -> None:
+        self.assertEqual(self.mirror.mirror(self.items, self.scheduler), {"downloaded": len(self.items)})
+        self.assert_mirrored()
+
+        self.stub.requests.clear()
+        self.assertEqual(self.mirror.mirror(self.items, self.scheduler), {"skipped": len(self.items)})
+        self.assertTrue(all(r["status"] == 304 for r in self.file_requests()))
+
+    def test_resume_partial_download_with_range(self) -> None:
+        self.mirror.mirror(self.items, self.scheduler)
+        item = self.items[0]
+        path = self.mirror.asset_path(item.release, item.asset)
+        content = path.read_bytes()
+        path.unlink()
+        path.with_name(path.name + cdda_releases.AssetMirror.PART_SUFFIX).write_bytes(content[:1000])
+
+        self.stub.requests.clear()
+        results = self.mirror.mirror(self.items, self.scheduler)
+
+        self.assertEqual(results, {"resumed": 1, "skipped": len(self.items) - 1})
+        ranges = [r["headers"].get("Range") for r in self.file_requests() if r["status"] == 206]
+        self.assertEqual(ranges, ["bytes=1000-"])
+        self.assert_mirrored()
+
+    def test_corrupted_download_is_retried_then_rejected(self) -> None:
+        item = self.items[0]
+        file_path = f"/files/{item.release.tag_name}/{item.asset.name}"
+        self.stub.files[file_path] = bytes(len(self.stub.files[file_path]))  # same size, wrong digest.
+        with self.assertRaises(cdda_releases.PageFetchError):
+            self.mirror.mirror([item], self.scheduler)
+        path = self.mirror.asset_path(item.release, item.asset)
+        self.assertFalse(path.exists())
+        self.assertFalse(path.with_name(path.name + cdda_releases.AssetMirror.PART_SUFFIX).exists())
+
+    def test_complete_partial_file_is_only_verified(self) -> None:
+        # the previous run stopped after the last chunk, before the rename.
+        self.mirror.mirror(self.items, self.scheduler)
+        item = self.items[0]
+        path = self.mirror.asset_path(item.release, item.asset)
+        path.rename(path.with_name(path.name + cdda_releases.AssetMirror.PART_SUFFIX))
+
+        self.stub.requests.clear()
+        results = self.mirror.mirror(self.items, self.scheduler)
+
+        self.assertEqual(results, {"resumed": 1, "skipped": len(self.items) - 1})
+        self.assertNotIn(item.asset.url, [self.stub.base_url + r["path"] for r in self.file_requests()])
+        self.assert_mirrored()
+
+    def test_unsatisfiable_range_restarts_the_download(self) -> None:
+        self.mirror.mirror(self.items, self.scheduler)
+        item = self.items[0]
+        path = self.mirror.asset_path(item.release, item.asset)
+        content = path.read_bytes()
+        path.unlink()
+        path.with_name(path.name + cdda_releases.AssetMirror.PART_SUFFIX).write_bytes(content + b"trailing bytes")
+
+        self.stub.requests.clear()
+        results = self.mirror.mirror(self.items, self.scheduler)
+
+        self.assertEqual(results, {"downloaded": 1, "skipped": len(self.items) - 1})
+        self.assertIn(416, [r["status"] for r in self.file_requests()])
+        self.assert_mirrored()
+
+    def test_permanent_error_only_fails_its_asset(self) -> None:
+        item = self.items[0]
+        del self.stub.files[f"/files/{item.release.tag_name}/{item.asset.name}"]
+
+        results = self.mirror.mirror(self.items, self.scheduler)
+
+        self.assertEqual(results, {"failed": 1, "downloaded": len(self.items) - 1})
+        self.assertFalse(self.mirror.asset_path(item.release, item.asset).exists())
+        for other in self.items[1:]:
+            self.assertTrue(self.mirror.asset_path(other.release, other.asset).is_file())
+
+
+if __name__ == "__main__":
+    unittest.main()
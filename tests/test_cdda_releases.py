@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import io
+import pathlib
+import random
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import cdda_releases
+from github_stub import StubTestCase
+
+
+class SchedulerRetryTest(StubTestCase):
+    def assert_all_releases_loaded(self, page_loader: cdda_releases.PageLoader) -> None:
+        self.assertEqual([r.tag_name for r in page_loader.releases], [r["tag_name"] for r in self.stub.releases])
+
+    def test_retries_transient_errors_and_keeps_fetched_pages(self) -> None:
+        self.stub.fail_plan = {
+            2: [{"status": 403, "headers": {"X-RateLimit-Remaining": "0",
+                                            "X-RateLimit-Reset": str(int(time.time()))}}],
+            3: [{"status": 429, "headers": {"Retry-After": "0"}}],
+            4: [{"status": 502}],
+        }
+        page_loader = self.make_page_loader()
+        page_loader.parse_releases()
+
+        self.assert_all_releases_loaded(page_loader)
+        # only the failed pages are requested again.
+        self.assertEqual([r["status"] for r in self.stub.page_requests(1)], [200])
+        for page_num, status in ((2, 403), (3, 429), (4, 502)):
+            self.assertEqual([r["status"] for r in self.stub.page_requests(page_num)], [status, 200])
+
+    def test_gives_up_after_max_retries(self) -> None:
+        self.stub.fail_plan = {2: [{"status": 502}] * 10}
+        page_loader = self.make_page_loader()
+        with self.assertRaises(cdda_releases.PageFetchError):
+            page_loader.parse_releases()
+        self.assertEqual(len(self.stub.page_requests(2)), self.scheduler.max_retries + 1)
+
+    def test_does_not_retry_permanent_errors(self) -> None:
+        # 403 without any rate limit header is a permission error.
+        self.stub.fail_plan = {2: [{"status": 403}, {"status": 403}]}
+        page_loader = self.make_page_loader()
+        with self.assertRaises(cdda_releases.PageFetchError) as context:
+            page_loader.parse_releases()
+        self.assertEqual(context.exception.status_code, 403)
+        self.assertEqual(len(self.stub.page_requests(2)), 1)
+
+
+class SyncReleasesTest(StubTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.store_path = pathlib.Path(tmp_dir.name) / "store.json"
+
+    def sync(self) -> cdda_releases.PageLoader:
+        page_loader = self.make_page_loader()
+        page_loader.sync_releases(cdda_releases.ReleaseStore(self.store_path), refresh_days=30)
+        return page_loader
+
+    def test_first_sync_fetches_the_whole_history(self) -> None:
+        self.stub.page_delay = 0.1
+        page_loader = self.sync()
+
+        self.assertEqual([r.tag_name for r in page_loader.releases], [r["tag_name"] for r in self.stub.releases])
+        self.assertEqual(sorted(r["page"] for r in self.stub.requests), [1, 2, 3, 4])
+        self.assertEqual(self.stub.max_concurrent_pages, 3)  # the pages after the first one, all at once.
+        self.assertEqual(len(cdda_releases.ReleaseStore(self.store_path)), self.NUM_RELEASES)
+        self.assertEqual([p.name for p in self.store_path.parent.iterdir()], [self.store_path.name])
+
+    def test_next_sync_stops_at_the_first_known_release(self) -> None:
+        self.sync()
+        self.stub.releases.insert(0, dict(self.stub.releases[0], id=200000, tag_name="cdda-experimental-new"))
+        self.stub.requests.clear()
+
+        page_loader = self.sync()
+
+        self.assertEqual([r["page"] for r in self.stub.requests], [1])
+        self.assertEqual(len(page_loader.releases), self.NUM_RELEASES + 1)
+        self.assertIn("cdda-experimental-new", [r.tag_name for r in page_loader.releases])
+
+
+class ReleaseIndexTest(unittest.TestCase):
+    ASSET_NAMES = ("cdda-windows-tiles-x64-{}.zip", "cdda-linux-curses-x64-{}.tar.gz", "cdda-osx-tiles-{}.dmg",
+                   "cdda-android-{}.apk", "cdda-{}-changelog.txt")
+
+    def setUp(self) -> None:
+        rng = random.Random(18)
+        releases = list()
+        for i in range(50):
+            tag = f"cdda-experimental-2024-{1 + i // 28:02d}-{1 + i % 28:02d}"
+            assets = [{"id": i * 10 + j, "name": name.format(tag), "label": "", "download_count": rng.randrange(500)}
+                      for (j, name) in enumerate(self.ASSET_NAMES)]
+            releases.append(cdda_releases.Release({"id": i, "tag_name": tag, "name": tag, "prerelease": True,
+                                                   "published_at": f"{tag[-10:]}T12:00:00Z", "assets": assets}))
+        self.releases = releases[::-1]  # newest first, as the API.
+        self.index = cdda_releases.ReleaseIndex.from_releases(self.releases)
+
+    def expected_top_assets(self, n, os_name=None, releases=None):
+        rows = [(a.download_count, r.tag_name, a.display_name) for r in (releases or self.releases) for a in r.assets
+                if os_name is None or (a.os_name or cdda_releases.UNCLASSIFIED) == os_name]
+        return sorted(rows, key=lambda row: -row[0])[:n]
+
+    def top_assets(self, n, *args, **kwargs):
+        return [(self.index.download_counts[j], self.index.tag_names[i], self.index.asset_names[j])
+                for (i, j) in self.index.top_assets(n, *args, **kwargs)]
+
+    def test_top_assets(self) -> None:
+        self.assertEqual(self.top_assets(10), self.expected_top_assets(10))
+        self.assertEqual(self.top_assets(1000), self.expected_top_assets(1000))
+
+    def test_top_assets_per_os(self) -> None:
+        for os_name in cdda_releases.EXPORT_OS_COLUMNS:
+            self.assertEqual(self.top_assets(7, os_name=os_name), self.expected_top_assets(7, os_name), os_name)
+
+    def test_top_assets_in_date_range(self) -> None:
+        since, until = "2024-01-10T00:00:00Z", "2024-01-20T00:00:00Z"
+        releases = [r for r in self.releases if since <= r.published_at <= until]
+        self.assertEqual(self.top_assets(5, since, until, os_name="Linux"),
+                         self.expected_top_assets(5, "Linux", releases))
+
+    def test_query_rejects_unknown_os(self) -> None:
+        out = io.StringIO()
+        cdda_releases.run_query(self.index, "top-assets 3 Windows", out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        with self.assertRaises(ValueError):
+            cdda_releases.run_query(self.index, "top-assets 3 BeOS", io.StringIO())
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    @staticmethod
+    def make_release(download_counts) -> cdda_releases.Release:
+        names = ("cdda-windows-tiles-x64-1.zip", "cdda-linux-curses-x64-1.tar.gz", "cdda-1-changelog.txt")
+        assets = [{"id": j, "name": name, "label": "", "download_count": count}
+                  for (j, (name, count)) in enumerate(zip(names, download_counts))]
+        return cdda_releases.Release({"id": 1, "tag_name": "cdda-1", "name": "cdda 1", "prerelease": False,
+                                      "published_at": "2024-01-01T00:00:00Z", "assets": assets})
+
+    def test_unclassified_assets_share_the_report_bucket(self) -> None:
+        first, second = self.make_release((10, 20, 30)), self.make_release((15, 20, 37))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with cdda_releases.SnapshotStore(pathlib.Path(tmp_dir) / "snapshots.db") as store:
+                start_id = store.record(cdda_releases.iter_asset_rows([first]), "2024-01-01T00:00:00Z")
+                end_id = store.record(cdda_releases.iter_asset_rows([second]), "2024-01-02T00:00:00Z")
+                deltas = dict(store.deltas(start_id, end_id, "os"))
+
+        self.assertEqual(deltas, {cdda_releases.UNCLASSIFIED: 7, "Windows": 5, "Linux": 0})
+        self.assertEqual(second.sum_os()[cdda_releases.UNCLASSIFIED], 37)
+        records = list(cdda_releases.iter_asset_records(second))
+        self.assertEqual(sorted(r["os"] for r in records), sorted(["Linux", "Windows", cdda_releases.UNCLASSIFIED]))
+
+    def test_columns_rows_match_the_release_rows(self) -> None:
+        release = self.make_release((1, 2, 3))
+        columns = cdda_releases.ReleaseColumns()
+        columns.append({"id": release.id, "tag_name": release.tag_name, "name": release.name,
+                        "published_at": release.published_at, "prerelease": False,
+                        "assets": [{"id": a.id, "name": a.name, "label": "", "download_count": a.download_count}
+                                   for a in release.assets]})
+        self.assertEqual(list(columns.iter_asset_rows()), list(cdda_releases.iter_asset_rows([release])))
+
+
+@unittest.skipIf(cdda_releases.pa is None, "pyarrow is not installed")
+class ParquetExporterTest(unittest.TestCase):
+    @staticmethod
+    def make_release(release_id: int, name, asset_names) -> cdda_releases.Release:
+        assets = [{"id": release_id * 10 + j, "name": asset_name, "label": "", "download_count": j}
+                  for (j, asset_name) in enumerate(asset_names)]
+        return cdda_releases.Release({"id": release_id, "tag_name": f"cdda-{release_id}", "name": name,
+                                      "prerelease": True, "published_at": "2024-01-01T00:00:00Z", "assets": assets})
+
+    def export(self, level: str, releases) -> list:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = pathlib.Path(tmp_dir) / f"{level}.parquet"
+            with mock.patch.object(cdda_releases.ParquetExporter, "ROW_GROUP_SIZE", 1):
+                with cdda_releases.Exporter.create("parquet", output_path, level) as exporter:
+                    for release in releases:
+                        exporter.write_release(release)
+            return cdda_releases.pa_parquet.read_table(str(output_path)).to_pylist()
+
+    def test_columns_null_in_the_first_row_group(self) -> None:
+        # the first row group only has a release without name and an unclassified asset (no os, ui nor arch).
+        releases = [self.make_release(1, None, ["cdda-1-changelog.txt"]),
+                    self.make_release(2, "cdda 2", ["cdda-windows-tiles-x64-2.zip"])]
+        self.assertEqual([r["name"] for r in self.export("release", releases)], [None, "cdda 2"])
+        records = self.export("asset", releases)
+        self.assertEqual([(r["os"], r["ui"]) for r in records],
+                         [(cdda_releases.UNCLASSIFIED, None), ("Windows", "tiles")])
+
+    def test_no_record_writes_an_empty_file(self) -> None:
+        self.assertEqual(self.export("asset", []), [])
+
+    def test_exporter_is_abstract(self) -> None:
+        with self.assertRaises(TypeError):
+            cdda_releases.Exporter(pathlib.Path("unused.jsonl"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import concurrent.futures
+import pathlib
+import tempfile
+import unittest
+
+from file_utils import atomic_write_text
+
+
+class AtomicWriteTextTest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dir = pathlib.Path(tmp_dir.name)
+
+    def test_write_and_replace(self) -> None:
+        path = self.dir / "file.json"
+        atomic_write_text(path, "first")
+        atomic_write_text(path, "second")
+        self.assertEqual(path.read_text(encoding="utf-8"), "second")
+        self.assertEqual(list(self.dir.iterdir()), [path])
+
+    def test_concurrent_writers(self) -> None:
+        path = self.dir / "file.json"
+        texts = [str(i) * 100000 for i in range(8)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda text: atomic_write_text(path, text), texts * 4))
+        self.assertIn(path.read_text(encoding="utf-8"), texts)
+        self.assertEqual(list(self.dir.iterdir()), [path])
+
+    def test_failed_write_leaves_no_temporary_file(self) -> None:
+        path = self.dir / "file.json"
+        with self.assertRaises(UnicodeEncodeError):
+            atomic_write_text(path, "\ud800")
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
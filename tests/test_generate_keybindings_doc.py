@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import json
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+from typing import List, Tuple
+
+import generate_keybindings_doc
+from generate_keybindings_doc import KeyBindingContainer
+
+
+def make_entry(id: str, bindings: List[Tuple[str, str]], category: str = "DEFAULTMODE") -> dict:
+    return {
+        "type": "keybinding",
+        "id": id,
+        "category": category,
+        "name": id.title(),
+        "bindings": [{"input_method": input_method, "key": key} for (input_method, key) in bindings],
+    }
+
+
+class FindConflictsTest(unittest.TestCase):
+    @staticmethod
+    def find_conflicts(entries, active_together=()) -> List[Tuple[str, str, str, List[str]]]:
+        conflicts = generate_keybindings_doc.find_conflicts(KeyBindingContainer(entries), active_together)
+        return sorted((c.context, c.input_method, c.key, sorted(action_id for (_, action_id) in c.actions))
+                      for c in conflicts)
+
+    def test_keyboard_any_clash_is_reported_once(self) -> None:
+        entries = [make_entry("open", [("keyboard_any", "e")]), make_entry("eat", [("keyboard_any", "e")])]
+        self.assertEqual(self.find_conflicts(entries),
+                         [("Defaultmode", "keyboard_char, keyboard_code", "e", ["eat", "open"])])
+
+    def test_keyboard_char_keys_are_case_sensitive(self) -> None:
+        entries = [make_entry("open", [("keyboard_char", "e")]), make_entry("eat", [("keyboard_char", "E")])]
+        self.assertEqual(self.find_conflicts(entries), [])
+
+    def test_keyboard_char_clashes_on_both_cases_are_both_reported(self) -> None:
+        entries = [make_entry("open", [("keyboard_char", "e"), ("keyboard_char", "E")]),
+                   make_entry("eat", [("keyboard_char", "e"), ("keyboard_char", "E")])]
+        self.assertEqual(self.find_conflicts(entries), [
+            ("Defaultmode", "keyboard_char", "E", ["eat", "open"]),
+            ("Defaultmode", "keyboard_char", "e", ["eat", "open"]),
+        ])
+
+    def test_keyboard_code_keys_are_case_insensitive(self) -> None:
+        entries = [make_entry("open", [("keyboard_code", "e")]), make_entry("eat", [("keyboard_code", "E")])]
+        self.assertEqual(self.find_conflicts(entries), [("Defaultmode", "keyboard_code", "e", ["eat", "open"])])
+
+    def test_keyboard_any_and_keyboard_char_clash(self) -> None:
+        entries = [make_entry("open", [("keyboard_any", "e")]), make_entry("eat", [("keyboard_char", "e")])]
+        self.assertEqual(self.find_conflicts(entries), [("Defaultmode", "keyboard_char", "e", ["eat", "open"])])
+
+    def test_categories_active_together(self) -> None:
+        entries = [make_entry("open", [("keyboard_char", "e")]),
+                   make_entry("examine", [("keyboard_char", "e")], category="LOOK"),
+                   make_entry("quit", [("keyboard_char", "q")], category="LOOK")]
+        self.assertEqual(self.find_conflicts(entries), [])
+        self.assertEqual(self.find_conflicts(entries, [["DEFAULTMODE", "LOOK"]]),
+                         [("Defaultmode + Look", "keyboard_char", "e", ["examine", "open"])])
+
+    def test_unbound_and_duplicate_bindings_are_ignored(self) -> None:
+        entries = [make_entry("open", [("keyboard_char", "e"), ("keyboard_any", "e")]),
+                   make_entry("eat", [("keyboard_char", "")])]
+        self.assertEqual(self.find_conflicts(entries), [])
+
+
+class RenderCacheTest(unittest.TestCase):
+    TEMPLATE = "header\n%{template}\nfooter\n"
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = pathlib.Path(tmp_dir.name)
+        self.entries = [make_entry(f"action_{i}", [("keyboard_char", chr(ord("a") + i % 26))], category)
+                        for i in range(120) for category in ("DEFAULTMODE", "LOOK", "INVENTORY")]
+
+    def render(self, entries, render_cache=None) -> str:
+        return generate_keybindings_doc.generate_latex_document(entries, self.TEMPLATE, render_cache)
+
+    def test_cached_output_is_identical(self) -> None:
+        expected = self.render(self.entries)
+        first_cache = generate_keybindings_doc.RenderCache(self.cache_dir)
+        self.assertEqual(self.render(self.entries, first_cache), expected)
+        self.assertEqual((first_cache.hits, first_cache.misses), (0, 3))
+
+        second_cache = generate_keybindings_doc.RenderCache(self.cache_dir)
+        self.assertEqual(self.render(self.entries, second_cache), expected)
+        self.assertEqual((second_cache.hits, second_cache.misses), (3, 0))
+
+    def test_only_changed_categories_are_rendered(self) -> None:
+        self.render(self.entries, generate_keybindings_doc.RenderCache(self.cache_dir))
+        entries = [dict(e, name="Renamed") if e["id"] == "action_7" and e["category"] == "LOOK" else e
+                   for e in self.entries]
+
+        render_cache = generate_keybindings_doc.RenderCache(self.cache_dir)
+        self.assertEqual(self.render(entries, render_cache), self.render(entries))
+        self.assertEqual((render_cache.hits, render_cache.misses), (2, 1))
+
+
+class LoadInputsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dir = pathlib.Path(tmp_dir.name)
+        self.main_file = self.write("keybindings.json", [make_entry("quit", [("keyboard_char", "q")])])
+        mods = self.dir / "mods"
+        self.write("mods/a/keybindings.json", [{"type": "item", "id": "rock"},
+                                               make_entry("throw", [("keyboard_char", "t")])])
+        self.write("mods/a/items.json", [{"type": "item", "id": "stick"}])
+        self.write("mods/b/single.json", make_entry("dig", [("keyboard_char", "D")]))
+        self.write("mods/b/empty.json", None)
+        self.mods = mods
+
+    def write(self, name: str, content) -> pathlib.Path:
+        path = self.dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(content) if content is not None else "", encoding="utf-8")
+        return path
+
+    def test_directories_only_keep_keybinding_entries(self) -> None:
+        inputs = list(generate_keybindings_doc.load_inputs([self.main_file, self.mods]))
+        self.assertEqual([path.relative_to(self.dir).as_posix() for (path, _) in inputs],
+                         ["keybindings.json", "mods/a/keybindings.json", "mods/b/single.json"])
+        self.assertEqual([[e["id"] for e in entries] for (_, entries) in inputs], [["quit"], ["throw"], ["dig"]])
+
+    def test_process_pool_gives_the_same_entries(self) -> None:
+        expected = list(generate_keybindings_doc.load_inputs([self.main_file, self.mods]))
+        with mock.patch.object(generate_keybindings_doc, "POOL_MIN_INPUT_SIZE", 0):
+            self.assertEqual(list(generate_keybindings_doc.load_inputs([self.main_file, self.mods], jobs=2)), expected)
+
+
+class MergeInputsTest(unittest.TestCase):
+    def test_later_entries_replace_earlier_ones_in_place(self) -> None:
+        base, mod = pathlib.Path("base.json"), pathlib.Path("mod.json")
+        inputs = [
+            (base, [make_entry("quit", [("keyboard_char", "q")]), make_entry("look", [("keyboard_char", "x")]),
+                    make_entry("quit", [("keyboard_char", "Q")], category="LOOK")]),
+            (mod, [make_entry("look", [("keyboard_char", "l")]), make_entry("dig", [("keyboard_char", "D")])]),
+        ]
+        merged, overrides = generate_keybindings_doc.merge_inputs(inputs)
+
+        self.assertEqual([(e["category"], e["id"], e["bindings"][0]["key"]) for e in merged], [
+            ("DEFAULTMODE", "quit", "q"),
+            ("DEFAULTMODE", "look", "l"),
+            ("LOOK", "quit", "Q"),
+            ("DEFAULTMODE", "dig", "D"),
+        ])
+        self.assertEqual(overrides, [generate_keybindings_doc.Override("DEFAULTMODE", "look", mod, base)])
+
+    def test_entries_without_category_are_general(self) -> None:
+        entry = {"type": "keybinding", "id": "quit", "bindings": []}
+        merged, overrides = generate_keybindings_doc.merge_inputs([(pathlib.Path("a.json"), [entry]),
+                                                                   (pathlib.Path("b.json"), [dict(entry)])])
+        self.assertEqual(len(merged), 1)
+        self.assertEqual([o.category for o in overrides], ["General"])
+
+
+class EscapeLatexTest(unittest.TestCase):
+    def test_escape_latex_text(self) -> None:
+        escape = generate_keybindings_doc.escape_latex_text
+        self.assertEqual(escape("Drop 100% & more_stuff #1 {x}"), r"Drop 100\% \& more\_stuff \#1 \{x\}")
+        self.assertEqual(escape("$"), r"\$")
+        self.assertEqual(escape("~"), r"\textasciitilde")
+        self.assertEqual(escape("^"), r"\textasciicircum")
+        self.assertEqual(escape("\\"), r"\textbackslash")
+        self.assertEqual(escape(" "), "<space>")
+        # only single characters are special cases.
+        self.assertEqual(escape("~ ^"), "~ ^")
+
+    def test_escape_latex_column(self) -> None:
+        texts = ["Quit", "100% & more", "~", " ", "a_b", "", "#", "\\", "{}"]
+        self.assertEqual(generate_keybindings_doc.escape_latex_column(texts),
+                         [generate_keybindings_doc.escape_latex_text(text) for text in texts])
+        self.assertEqual(generate_keybindings_doc.escape_latex_column([]), [])
+
+    def test_escape_latex_column_with_separator_in_text(self) -> None:
+        texts = ["a\0b_c", "d&e"]
+        self.assertEqual(generate_keybindings_doc.escape_latex_column(texts), ["a\0b\\_c", "d\\&e"])
+
+
+if __name__ == "__main__":
+    unittest.main()
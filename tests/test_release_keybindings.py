@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import tarfile
+import unittest
+import zipfile
+from typing import Dict, List
+
+import cdda_releases
+import release_keybindings
+from github_stub import StubTestCase
+from release_keybindings import ArchiveSource
+
+KEYBINDINGS = [{"type": "keybinding", "id": "QUIT", "category": "DEFAULTMODE", "name": "Quit",
+                "bindings": [{"input_method": "keyboard_any", "key": "q"}]}]
+
+
+def make_zip(members: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def make_tar(members: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+class LoadArchiveKeybindingsTest(StubTestCase):
+    NUM_RELEASES = 1
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.session = cdda_releases.create_session()
+        self.addCleanup(self.session.close)
+        content = json.dumps(KEYBINDINGS).encode("utf-8")
+        self.stub.files["/files/game.zip"] = make_zip({"cdda/" + release_keybindings.KEYBINDINGS_MEMBER: content})
+        self.stub.files["/files/game.tar.gz"] = make_tar({"cdda/" + release_keybindings.KEYBINDINGS_MEMBER: content})
+        self.stub.files["/files/source.zip"] = make_zip({"cdda/README.md": b"readme"})
+
+    def load(self, path: str):
+        source = ArchiveSource(path, url=self.stub.base_url + path)
+        return release_keybindings.load_source_keybindings(source, self.session)
+
+    def statuses(self, path: str) -> List[int]:
+        return [r["status"] for r in self.stub.requests if r["path"] == path]
+
+    def test_zip_member_is_read_with_range_requests(self) -> None:
+        self.assertEqual(self.load("/files/game.zip"), KEYBINDINGS)
+        statuses = self.statuses("/files/game.zip")
+        # HEAD, then range requests only.
+        self.assertEqual(statuses[0], 200)
+        self.assertTrue(statuses[1:])
+        self.assertTrue(all(status == 206 for status in statuses[1:]))
+
+    def test_zip_is_downloaded_without_range_support(self) -> None:
+        self.stub.accept_ranges = False
+        self.assertEqual(self.load("/files/game.zip"), KEYBINDINGS)
+        self.assertEqual(self.statuses("/files/game.zip"), [200, 200])  # HEAD, then the whole archive.
+
+    def test_tar_member_is_streamed(self) -> None:
+        self.assertEqual(self.load("/files/game.tar.gz"), KEYBINDINGS)
+
+    def test_archive_without_keybindings_is_skipped(self) -> None:
+        self.assertIsNone(self.load("/files/source.zip"))
+
+    def test_missing_archive_is_skipped(self) -> None:
+        self.assertIsNone(self.load("/files/removed.zip"))
+        self.assertEqual(self.statuses("/files/removed.zip"), [404])
+
+
+class LatestReleasesTest(StubTestCase):
+    def test_only_the_pages_of_the_latest_releases_are_fetched(self) -> None:
+        page_loader = self.make_page_loader(max_releases=2)
+        page_loader.parse_releases()
+
+        self.assertEqual([r.tag_name for r in page_loader.releases],
+                         [r["tag_name"] for r in self.stub.releases[:2]])
+        self.assertEqual([r["page"] for r in self.stub.requests], [1])
+
+    def test_pages_are_fetched_until_enough_releases_match(self) -> None:
+        # half of the releases match: the first 60 of them are on the first two pages.
+        release_filter = cdda_releases.ReleaseFilter(tag_pattern="*[02468]")
+        page_loader = cdda_releases.PageLoader("owner", "repo", workers=1, scheduler=self.scheduler,
+                                               url_template=self.stub.url_template, release_filter=release_filter,
+                                               max_releases=60)
+        page_loader.parse_releases()
+
+        self.assertEqual([r.tag_name for r in page_loader.releases],
+                         [r["tag_name"] for r in self.stub.releases[:120:2]])
+        self.assertEqual([r["page"] for r in self.stub.requests], [1, 2])
+
+if __name__ == "__main__":
+    unittest.main()
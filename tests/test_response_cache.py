@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import tempfile
+import unittest
+
+import cdda_releases
+from github_stub import StubTestCase
+
+
+class ResponseCacheTest(StubTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = pathlib.Path(tmp_dir.name)
+
+    def test_not_modified_pages_are_served_from_the_cache(self) -> None:
+        first = self.make_page_loader(cache=cdda_releases.ResponseCache(self.cache_dir))
+        first.parse_releases()
+        self.stub.requests.clear()
+
+        # a new cache object: the entries are read back from disk.
+        second = self.make_page_loader(cache=cdda_releases.ResponseCache(self.cache_dir))
+        second.parse_releases()
+
+        self.assertEqual(len(self.stub.requests), 4)
+        self.assertTrue(all(r["status"] == 304 for r in self.stub.requests))
+        self.assertTrue(all("If-None-Match" in r["headers"] for r in self.stub.requests))
+        self.assertEqual([r.tag_name for r in second.releases], [r.tag_name for r in first.releases])
+        self.assertEqual(second.total_downloads(), first.total_downloads())
+
+    def test_in_memory_cache(self) -> None:
+        cache = cdda_releases.ResponseCache(None)
+        self.make_page_loader(cache=cache).parse_releases()
+        self.stub.requests.clear()
+
+        page_loader = self.make_page_loader(cache=cache)
+        page_loader.parse_releases()
+
+        self.assertEqual([r["status"] for r in self.stub.requests], [304] * 4)
+        self.assertEqual(len(page_loader.releases), self.NUM_RELEASES)
+        self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+    def test_modified_page_is_fetched_again(self) -> None:
+        self.make_page_loader(cache=cdda_releases.ResponseCache(self.cache_dir)).parse_releases()
+        self.stub.releases[0]["assets"][0]["download_count"] += 1000
+        self.stub.requests.clear()
+
+        page_loader = self.make_page_loader(cache=cdda_releases.ResponseCache(self.cache_dir))
+        page_loader.parse_releases()
+
+        self.assertEqual([r["status"] for r in self.stub.requests], [200, 304, 304, 304])
+        download_counts = {asset.id: asset.download_count for asset in page_loader.releases[0].assets}
+        asset_content = self.stub.releases[0]["assets"][0]
+        self.assertEqual(download_counts[asset_content["id"]], asset_content["download_count"])
+
+    def test_unreadable_entry_is_ignored(self) -> None:
+        self.make_page_loader(cache=cdda_releases.ResponseCache(self.cache_dir)).parse_releases()
+        for entry_path in self.cache_dir.glob("*.json"):
+            entry_path.write_text("{not json", encoding="utf-8")
+        self.stub.requests.clear()
+
+        page_loader = self.make_page_loader(cache=cdda_releases.ResponseCache(self.cache_dir))
+        page_loader.parse_releases()
+
+        self.assertEqual([r["status"] for r in self.stub.requests], [200] * 4)
+        self.assertEqual(len(page_loader.releases), self.NUM_RELEASES)
+
+
+if __name__ == "__main__":
+    unittest.main()